@@ -0,0 +1,192 @@
+"""
+Analytics
+Incrementally maintained statistics over the daily study history
+Days are kept as dense columns (one slot per calendar day) with prefix
+sums and streak run lengths, so rolling totals, streaks and weekday
+averages are answered in O(1) and today's save updates them in O(1)
+"""
+
+import functools
+from array import array
+from datetime import date
+from itertools import accumulate
+
+
+@functools.lru_cache(maxsize=None)
+def load_numpy():
+    """numpy, imported on first use since it takes ~100 ms; None if it is not installed"""
+    try:
+        import numpy
+    except ImportError:  # in requirements.txt; without it bulk work falls back to pure Python
+        return None
+    return numpy
+
+
+class StudyAnalytics:
+    """Rolling totals, streaks and weekday averages over daily history"""
+
+    def __init__(self, history=None):
+        self.version = 0  # bumped on every change, so derived views know when to refresh
+        self.rebuild(history or {})
+
+    def rebuild(self, history):
+        """Recompute every aggregate from a {date string: record} dict"""
+        self.version += 1
+        days = sorted((date.fromisoformat(day).toordinal(), record) for day, record in history.items())
+        self.first_day = days[0][0] if days else None
+        length = days[-1][0] - days[0][0] + 1 if days else 0
+
+        # Columnar view: one slot per calendar day, zero where nothing was recorded
+        self.minutes = array('d', bytes(8 * length))
+        self.sessions = array('d', bytes(8 * length))
+        for ordinal, record in days:
+            index = ordinal - self.first_day
+            self.minutes[index] = record.get('total_study_time', 0)
+            self.sessions[index] = record.get('session_count', 0)
+
+        numpy = load_numpy() if length else None
+        if numpy is not None:
+            self._rebuild_vectorized(numpy)
+        else:
+            self._rebuild_python()
+
+    def _rebuild_vectorized(self, numpy):
+        minutes = numpy.frombuffer(self.minutes, dtype=numpy.float64)
+        sessions = numpy.frombuffer(self.sessions, dtype=numpy.float64)
+        zero = numpy.zeros(1)
+        self.prefix_minutes = array('d', numpy.concatenate((zero, numpy.cumsum(minutes))).tobytes())
+        self.prefix_sessions = array('d', numpy.concatenate((zero, numpy.cumsum(sessions))).tobytes())
+
+        # Run length of studied days ending at each index: position minus the
+        # position of the most recent unstudied day
+        studied = minutes > 0
+        positions = numpy.arange(len(minutes))
+        last_gap = numpy.maximum.accumulate(numpy.where(studied, -1, positions))
+        runs = numpy.where(studied, positions - last_gap, 0)
+        self.runs = array('l', runs.astype(numpy.int64).tolist())
+        self.longest_streak = int(runs.max())
+
+        weekdays = (positions + self.first_day - 1) % 7  # ordinal 1 is a Monday
+        self.weekday_minutes = numpy.bincount(weekdays, weights=minutes, minlength=7).tolist()
+        self.weekday_days = numpy.bincount(weekdays, minlength=7).tolist()
+
+    def _rebuild_python(self):
+        self.prefix_minutes = array('d', accumulate(self.minutes, initial=0.0))
+        self.prefix_sessions = array('d', accumulate(self.sessions, initial=0.0))
+
+        self.runs = array('l')
+        run = 0
+        for value in self.minutes:
+            run = run + 1 if value > 0 else 0
+            self.runs.append(run)
+        self.longest_streak = max(self.runs, default=0)
+
+        self.weekday_minutes = [0.0] * 7
+        self.weekday_days = [0] * 7
+        for index, value in enumerate(self.minutes):
+            weekday = (self.first_day + index - 1) % 7
+            self.weekday_minutes[weekday] += value
+            self.weekday_days[weekday] += 1
+
+    def record(self, day, session_count, total_study_time):
+        """Set one day's totals; O(1) for the most recent day"""
+        ordinal = date.fromisoformat(day).toordinal()
+        self.version += 1
+        if self.first_day is None:
+            self.first_day = ordinal
+        if ordinal < self.first_day:
+            # A day before the history began (e.g. an import); rare, so rebuild
+            history = self.to_history()
+            history[day] = {'session_count': session_count, 'total_study_time': total_study_time}
+            self.rebuild(history)
+            return
+
+        index = ordinal - self.first_day
+        while len(self.minutes) <= index:
+            self._append_empty_day()
+
+        minutes_delta = total_study_time - self.minutes[index]
+        sessions_delta = session_count - self.sessions[index]
+        self.minutes[index] = total_study_time
+        self.sessions[index] = session_count
+        self.weekday_minutes[(ordinal - 1) % 7] += minutes_delta
+        for i in range(index + 1, len(self.prefix_minutes)):
+            self.prefix_minutes[i] += minutes_delta
+            self.prefix_sessions[i] += sessions_delta
+
+        self._update_runs(index)
+
+    def _append_empty_day(self):
+        ordinal = self.first_day + len(self.minutes)
+        self.minutes.append(0.0)
+        self.sessions.append(0.0)
+        self.prefix_minutes.append(self.prefix_minutes[-1])
+        self.prefix_sessions.append(self.prefix_sessions[-1])
+        self.runs.append(0)
+        self.weekday_days[(ordinal - 1) % 7] += 1
+
+    def _update_runs(self, index):
+        """Refresh streak run lengths from index until they stop changing"""
+        shrank = False
+        for i in range(index, len(self.runs)):
+            previous = self.runs[i - 1] if i > 0 else 0
+            run = previous + 1 if self.minutes[i] > 0 else 0
+            if i > index and run == self.runs[i]:
+                break
+            shrank = shrank or run < self.runs[i]
+            self.runs[i] = run
+            self.longest_streak = max(self.longest_streak, run)
+        if shrank:
+            self.longest_streak = max(self.runs, default=0)
+
+    def _index(self, day):
+        return day.toordinal() - self.first_day
+
+    def rolling_totals(self, days, today=None):
+        """Minutes and sessions over the `days` days ending with today"""
+        if self.first_day is None:
+            return {'minutes': 0.0, 'sessions': 0.0}
+        end = self._index(today or date.today()) + 1
+        start = end - days
+        end = max(0, min(end, len(self.minutes)))
+        start = max(0, min(start, end))
+        return {
+            'minutes': self.prefix_minutes[end] - self.prefix_minutes[start],
+            'sessions': self.prefix_sessions[end] - self.prefix_sessions[start],
+        }
+
+    def current_streak(self, today=None):
+        """Consecutive studied days ending today (or yesterday, if today has no study yet)"""
+        if self.first_day is None:
+            return 0
+        index = self._index(today or date.today())
+        for i in (index, index - 1):
+            if 0 <= i < len(self.runs) and self.runs[i]:
+                return self.runs[i]
+        return 0
+
+    def weekday_averages(self):
+        """Average minutes studied per weekday, Monday first"""
+        return [minutes / days if days else 0.0
+                for minutes, days in zip(self.weekday_minutes, self.weekday_days)]
+
+    def summary(self, today=None):
+        """All statistics as one dict"""
+        today = today or date.today()
+        return {
+            'last_7_days': self.rolling_totals(7, today),
+            'last_30_days': self.rolling_totals(30, today),
+            'last_365_days': self.rolling_totals(365, today),
+            'current_streak': self.current_streak(today),
+            'longest_streak': self.longest_streak,
+            'weekday_average_minutes': self.weekday_averages(),
+        }
+
+    def to_history(self):
+        """The recorded days as a {date string: record} dict"""
+        history = {}
+        for index, (minutes, sessions) in enumerate(zip(self.minutes, self.sessions)):
+            if minutes or sessions:
+                day = date.fromordinal(self.first_day + index).isoformat()
+                history[day] = {'session_count': sessions, 'total_study_time': minutes}
+        return history
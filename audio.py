@@ -0,0 +1,437 @@
+"""
+Audio
+Decoded-once sound playback for the study timer
+Sounds are decoded to PCM a single time and cached in memory; repeats are
+written from that buffer to one long-lived output stream instead of
+spawning a player process for every ring. The background track is decoded
+once to a cached WAV and streamed from a memory map in a gapless loop
+"""
+
+import functools
+import logging
+import mmap
+import os
+import platform
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+
+from metrics import AUDIO_SPAWNS, trace
+
+try:
+    import sounddevice
+except (ImportError, OSError):  # in requirements.txt; OSError if PortAudio itself is missing
+    sounddevice = None  # then only Linux (pacat) can stream
+
+log = logging.getLogger("study_timer.audio")
+
+CHUNK_SECONDS = 0.02  # stop requests are honoured between chunks
+# How far ahead of real time audio may be queued in the pacat pipe; without a
+# cap the pipe buffer holds ~0.4 s that keeps playing after a pause
+PACAT_LEAD_SECONDS = 0.06
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "study_timer")
+
+
+class PcmSound:
+    """Decoded audio held in memory"""
+
+    def __init__(self, frames, rate, channels, sampwidth):
+        self.frames = frames
+        self.rate = rate
+        self.channels = channels
+        self.sampwidth = sampwidth
+
+    @property
+    def format(self):
+        return (self.rate, self.channels, self.sampwidth)
+
+    @property
+    def chunk_bytes(self):
+        frame_size = self.channels * self.sampwidth
+        return max(frame_size, int(self.rate * CHUNK_SECONDS) * frame_size)
+
+
+def read_wav(path):
+    """Read a PCM WAV file into a PcmSound"""
+    with wave.open(path, 'rb') as f:
+        return PcmSound(f.readframes(f.getnframes()), f.getframerate(),
+                        f.getnchannels(), f.getsampwidth())
+
+
+def wav_data_span(path):
+    """Return (offset, length) of the PCM data chunk in a WAV file"""
+    with open(path, 'rb') as f:
+        riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise ValueError(f"{path} is not a WAV file")
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'data':
+                return f.tell(), size
+            f.seek(size + (size & 1), os.SEEK_CUR)  # chunks are word aligned
+
+
+def cached_wav(path):
+    """Decode path to a WAV in the cache directory once and reuse it afterwards"""
+    stat = os.stat(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    wav_path = os.path.join(CACHE_DIR, f"{name}-{int(stat.st_mtime)}-{stat.st_size}.wav")
+    if not os.path.exists(wav_path):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = wav_path + ".tmp.wav"
+        decode_to_wav(path, tmp_path)
+        os.replace(tmp_path, wav_path)
+    return wav_path
+
+
+def decode_to_wav(path, output_path):
+    """Convert any audio file to 16-bit PCM WAV with the platform's decoder"""
+    if platform.system() == "Darwin":
+        command = ["afconvert", "-f", "WAVE", "-d", "LEI16", path, output_path]
+    elif shutil.which("ffmpeg"):
+        command = ["ffmpeg", "-loglevel", "error", "-y", "-i", path,
+                   "-acodec", "pcm_s16le", output_path]
+    else:
+        raise RuntimeError(f"No decoder available for {path}")
+    count_spawn(command)
+    subprocess.run(command, check=True, capture_output=True)
+
+
+def count_spawn(command):
+    """Record an audio helper process launch"""
+    AUDIO_SPAWNS.inc()
+    trace("audio_spawn", command=command[0])
+
+
+@functools.lru_cache(maxsize=8)
+def load_sound(path):
+    """Decode a sound file once and keep its PCM in memory"""
+    if path.lower().endswith(".wav"):
+        return read_wav(path)
+    # AIFF/MP3 are converted once through a temporary WAV
+    fd, wav_path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        decode_to_wav(path, wav_path)
+        return read_wav(wav_path)
+    finally:
+        os.remove(wav_path)
+
+
+class SounddeviceSink:
+    """Output stream through the sounddevice package"""
+
+    def __init__(self, rate, channels, sampwidth):
+        self.stream = sounddevice.RawOutputStream(
+            samplerate=rate, channels=channels, dtype=f"int{sampwidth * 8}")
+        self.stream.start()
+
+    def write(self, chunk):
+        self.stream.write(chunk)
+
+    def drop(self):
+        """Discard everything queued but not yet played"""
+        self.stream.abort()
+        self.stream.start()
+
+    def close(self):
+        self.stream.abort()
+        self.stream.close()
+
+
+class PacatSink:
+    """One long-lived pacat process fed raw PCM on stdin (PulseAudio/PipeWire)"""
+
+    FORMATS = {1: "u8", 2: "s16le", 4: "s32le"}
+
+    def __init__(self, rate, channels, sampwidth):
+        self.command = ["pacat", "--playback", "--raw", f"--format={self.FORMATS[sampwidth]}",
+                        f"--rate={rate}", f"--channels={channels}", "--latency-msec=50"]
+        self.bytes_per_second = rate * channels * sampwidth
+        self.process = None
+        self._started = None  # monotonic time the queued audio started playing
+        self._written = 0  # bytes written since _started
+        self._spawn()
+
+    def _spawn(self):
+        count_spawn(self.command)
+        self.process = subprocess.Popen(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def write(self, chunk):
+        if self.process is None:
+            self._spawn()  # after close()
+        # The pipe never blocks until it is full, so pace writes to real time
+        now = time.monotonic()
+        ahead = self._written / self.bytes_per_second - (now - self._started) if self._started else -1
+        if ahead < 0:
+            self._started, self._written = now, 0  # first write, or the stream ran dry
+        elif ahead > PACAT_LEAD_SECONDS:
+            time.sleep(ahead - PACAT_LEAD_SECONDS)
+        self.process.stdin.write(chunk)
+        self.process.stdin.flush()
+        self._written += len(chunk)
+
+    def drop(self):
+        """Stop feeding pacat, keeping the process for the next write
+
+        Writes run at most PACAT_LEAD_SECONDS ahead, so only that and pacat's
+        own latency still plays out
+        """
+        self._started = None  # the next write starts pacing afresh
+
+    def close(self):
+        # Killing drops whatever is still buffered, so stopping is immediate
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+        self._started = None
+
+
+def can_stream():
+    """True if open_sink has a backend to try, so decoding a sound up front is worthwhile"""
+    return sounddevice is not None or (platform.system() == "Linux" and shutil.which("pacat") is not None)
+
+
+def open_sink(rate, channels, sampwidth):
+    """Open a persistent output stream, or None when no backend is available"""
+    if sounddevice is not None:
+        return SounddeviceSink(rate, channels, sampwidth)
+    if platform.system() == "Linux" and shutil.which("pacat") and sampwidth in PacatSink.FORMATS:
+        return PacatSink(rate, channels, sampwidth)
+    return None
+
+
+class AlarmWorker:
+    """Long-lived thread that rings a notification sound until stopped"""
+
+    def __init__(self, interval=2.5):
+        self.interval = interval  # seconds of silence between rings
+        self._cond = threading.Condition()
+        self._sound_path = None
+        self._ringing = False
+        self._generation = 0  # bumped on every ring/stop so playback can bail out
+        self._sink = None
+        self._sink_format = None
+        self._thread = None
+
+    def ring(self, sound_path):
+        """Start ringing sound_path (None rings the system beep)"""
+        with self._cond:
+            self._sound_path = sound_path
+            self._ringing = True
+            self._generation += 1
+            self._cond.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop ringing; playback stops within one chunk"""
+        with self._cond:
+            if self._ringing:
+                self._ringing = False
+                self._generation += 1
+                self._cond.notify()
+
+    def _current(self, generation):
+        return self._ringing and self._generation == generation
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._ringing)
+                generation = self._generation
+                sound_path = self._sound_path
+
+            try:
+                self._play_once(sound_path, generation)
+            except Exception as e:
+                log.error("Sound error: %s", e)
+                self._close_sink()
+
+            # Wait out the gap between rings, waking early on stop/ring
+            with self._cond:
+                self._cond.wait_for(lambda: not self._current(generation), timeout=self.interval)
+
+    def _play_once(self, sound_path, generation):
+        if sound_path is None:
+            import winsound
+            winsound.Beep(1000, 200)  # 1000 Hz for 200ms (shorter beep)
+            return
+
+        # Without a streaming backend, decoding would only add a converter spawn
+        sink = None
+        if can_stream():
+            sound = load_sound(sound_path)
+            sink = self._sink_for(sound)
+        if sink is None:
+            # No streaming backend; fall back to the platform player
+            self._play_with_player(sound_path)
+            return
+
+        chunk_bytes = sound.chunk_bytes
+        for offset in range(0, len(sound.frames), chunk_bytes):
+            if not self._current(generation):
+                self._close_sink()  # drop anything still buffered
+                return
+            sink.write(sound.frames[offset:offset + chunk_bytes])
+
+    def _sink_for(self, sound):
+        """Reuse the open stream unless the sound needs a different format"""
+        if self._sink is not None and self._sink_format != sound.format:
+            self._close_sink()
+        if self._sink is None:
+            self._sink = open_sink(*sound.format)
+            self._sink_format = sound.format
+        return self._sink
+
+    def _close_sink(self):
+        if self._sink is not None:
+            try:
+                self._sink.close()
+            finally:
+                self._sink = None
+                self._sink_format = None
+
+    def _play_with_player(self, sound_path):
+        player = "afplay" if platform.system() == "Darwin" else "paplay"
+        count_spawn([player])
+        result = subprocess.run([player, sound_path], capture_output=True, text=True)
+        if result.returncode != 0:
+            log.warning("Sound failed: %s", result.stderr)
+            if platform.system() == "Darwin":
+                # Fallback to system beep
+                count_spawn(["osascript"])
+                subprocess.run(["osascript", "-e", "beep"], capture_output=True)
+
+
+class BackgroundTrack:
+    """Gapless, resumable looping playback of a long audio file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._cond = threading.Condition()
+        self._playing = False
+        self._thread = None
+
+        # Set up on the worker thread the first time the track plays
+        self._prepared = False
+        self._mm = None
+        self._data_start = 0
+        self._data_length = 0
+        self._chunk_bytes = 0
+        self._sink = None
+        self.offset = 0  # bytes into the PCM data; kept across pauses
+
+    def play(self):
+        """Start or resume playback from the saved offset (never blocks)"""
+        with self._cond:
+            self._playing = True
+            self._cond.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def pause(self):
+        """Pause playback, keeping the offset (never blocks)"""
+        with self._cond:
+            self._playing = False
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._playing)
+
+            if not self._prepared:
+                self._prepare()
+
+            if self._sink is not None:
+                self._stream()
+            else:
+                self._run_player()
+
+    def _prepare(self):
+        """Decode once, memory-map the PCM and open a persistent output stream"""
+        self._prepared = True
+        try:
+            if not can_stream():
+                return  # the player plays the file as it is
+            wav_path = self.path if self.path.lower().endswith(".wav") else cached_wav(self.path)
+            with wave.open(wav_path, 'rb') as f:
+                rate, channels, sampwidth = f.getframerate(), f.getnchannels(), f.getsampwidth()
+            self._data_start, self._data_length = wav_data_span(wav_path)
+            sink = open_sink(rate, channels, sampwidth)
+            if sink is None or self._data_length == 0:
+                return
+            with open(wav_path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            frame_size = channels * sampwidth
+            self._data_length -= self._data_length % frame_size
+            self._chunk_bytes = max(frame_size, int(rate * CHUNK_SECONDS) * frame_size)
+            self._sink = sink
+        except Exception as e:
+            log.warning("Streaming unavailable, using the system player: %s", e)
+
+    def _stream(self):
+        """Write chunks while playing, wrapping to the start without a gap"""
+        start, length = self._data_start, self._data_length
+        while self._playing:
+            end = min(self.offset + self._chunk_bytes, length)
+            chunk = self._mm[start + self.offset:start + end]
+            if end == length:
+                # Top the chunk up from the beginning so the loop point is seamless
+                end = min(self._chunk_bytes - len(chunk), length)
+                chunk += self._mm[start:start + end]
+            try:
+                self._sink.write(chunk)
+            except Exception as e:
+                log.error("Failed to play audio: %s", e)
+                self._sink = None
+                return
+            self.offset = end
+        # Paused: discard what is still queued rather than let it play out (pacat
+        # keeps only its capped lead, and keeps its process for the resume)
+        try:
+            self._sink.drop()
+        except Exception as e:
+            log.error("Failed to pause audio: %s", e)
+            self._sink = None
+
+    def _run_player(self):
+        """Fallback: loop the file with the platform player while playing"""
+        if platform.system() == "Windows":
+            log.warning("Audio playback on Windows needs the sounddevice package")
+            with self._cond:
+                self._cond.wait_for(lambda: not self._playing)
+            return
+
+        player = "afplay" if platform.system() == "Darwin" else "paplay"
+        process = None
+        try:
+            while True:
+                if process is None or process.poll() is not None:
+                    count_spawn([player])
+                    process = subprocess.Popen([player, self.path],
+                                               stdout=subprocess.DEVNULL,
+                                               stderr=subprocess.DEVNULL)
+                with self._cond:
+                    if self._cond.wait_for(lambda: not self._playing, timeout=0.5):
+                        break
+        except Exception as e:
+            log.error("Failed to play audio: %s", e)
+            with self._cond:
+                self._cond.wait_for(lambda: not self._playing)
+        finally:
+            if process is not None and process.poll() is None:
+                # No wait() here; subprocess reaps the child later
+                process.terminate()
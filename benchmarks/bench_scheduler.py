@@ -0,0 +1,80 @@
+"""
+Scheduler Benchmark
+Starts thousands of short timers on one TimerScheduler and reports
+setup cost, memory per timer and how late completions fire
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from timer_server import TimerScheduler
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_benchmark(timer_count, min_seconds, max_seconds):
+    scheduler = TimerScheduler()
+    run_task = asyncio.ensure_future(scheduler.run())
+    await asyncio.sleep(0)
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    ids = []
+    for _ in range(timer_count):
+        # Durations are in minutes; spread the deadlines so they do not all fire at once
+        seconds = random.uniform(min_seconds, max_seconds)
+        ids.append(scheduler.create(seconds / 60, seconds / 60))
+    create_seconds = time.perf_counter() - started
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for timer_id in ids:
+        scheduler.start(timer_id)
+    start_seconds = time.perf_counter() - started
+
+    while scheduler.completions < timer_count:
+        await asyncio.sleep(0.05)
+    run_task.cancel()
+
+    lateness = [scheduler.timers[timer_id].countdown.drift.completion_error for timer_id in ids]
+    return {
+        'timers': timer_count,
+        'threads': threading.active_count(),
+        'create_us_per_timer': create_seconds / timer_count * 1e6,
+        'start_us_per_timer': start_seconds / timer_count * 1e6,
+        'bytes_per_idle_timer': (after - before) / timer_count,
+        'completion_lateness_ms': {
+            'p50': percentile(lateness, 0.50) * 1000,
+            'p99': percentile(lateness, 0.99) * 1000,
+            'max': max(lateness) * 1000,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--timers", type=int, default=10000)
+    parser.add_argument("--min-seconds", type=float, default=1.0)
+    parser.add_argument("--max-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    result = asyncio.run(run_benchmark(args.timers, args.min_seconds, args.max_seconds))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Startup Benchmark
+Launches study_timer.py cold with --profile-startup and fails when the
+median time to the first visible frame exceeds the budget
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "study_timer.py"))
+
+
+def has_display():
+    """Tk needs an X display on Linux; run under xvfb-run when headless"""
+    return not sys.platform.startswith("linux") or bool(os.environ.get("DISPLAY"))
+
+
+def run_once(workdir):
+    profile_file = os.path.join(workdir, "startup.json")
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, SCRIPT, "--profile-startup", profile_file, "--quit-after-startup"],
+        cwd=workdir, capture_output=True, text=True, timeout=60,
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    with open(profile_file) as f:
+        profile = json.load(f)
+    profile['process_wall_ms'] = wall_ms
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=500.0,
+                        help="maximum median time from interpreter start to the first frame")
+    parser.add_argument("--history", help="data.json to copy into the working directory")
+    args = parser.parse_args()
+
+    if not has_display():
+        print(json.dumps({'skipped': "no display; run under xvfb-run"}))
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix="study_timer_startup_")
+    try:
+        if args.history:
+            os.makedirs(os.path.join(workdir, "data"))
+            shutil.copy(args.history, os.path.join(workdir, "data", "data.json"))
+        runs = [run_once(workdir) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    first_frame = statistics.median(run['first_frame_ms'] for run in runs)
+    summary = {
+        'runs': args.runs,
+        'median_first_frame_ms': first_frame,
+        'median_process_wall_ms': statistics.median(run['process_wall_ms'] for run in runs),
+        'median_phases_ms': {
+            phase: statistics.median(run['phases_ms'][phase] for run in runs)
+            for phase in runs[0]['phases_ms']
+        },
+        'budget_ms': args.budget_ms,
+        'passed': first_frame <= args.budget_ms,
+    }
+    print(json.dumps(summary, indent=2))
+    return 0 if summary['passed'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
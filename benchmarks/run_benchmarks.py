@@ -0,0 +1,333 @@
+"""
+Benchmark Suite
+Measures persistence and sync cost across synthetic history sizes, history
+chart rendering, countdown drift, button-to-redraw latency and cold start,
+and writes the results as JSON
+Run headless on Linux under xvfb-run to include the Tk measurements
+"""
+
+import argparse
+import json
+import os
+import platform
+import queue
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from analytics import StudyAnalytics
+from bench_startup import has_display, run_once as run_cold_start
+from charts import GRANULARITIES, ChartRenderer, ChartView, HistorySnapshot, render
+from events import EventStore
+from storage import WriteBehindStorage, open_storage
+from sync import SyncClient, SyncState, sync
+from sync_server import make_server
+from timer_engine import DeadlineTimer, StudyEngine, TimerWorker, simulate
+
+# Synthetic history sizes, in days: 1 day up to 20 years
+HISTORY_SIZES = {
+    '1_day': 1,
+    '1_month': 30,
+    '1_year': 365,
+    '5_years': 5 * 365,
+    '20_years': 20 * 365,
+}
+
+
+def synthetic_history(days, seed=0):
+    """A {date: record} history ending yesterday, with some days skipped"""
+    rng = random.Random(seed)
+    end = date.today() - timedelta(days=1)
+    history = {}
+    for offset in range(days):
+        day = end - timedelta(days=offset)
+        if days > 1 and rng.random() < 0.2:
+            continue
+        sessions = rng.randint(1, 10) + rng.random()
+        history[day.isoformat()] = {
+            'session_count': sessions,
+            'total_study_time': sessions * 25,
+            'last_updated': datetime.combine(day, datetime.min.time()).isoformat(),
+        }
+    return history
+
+
+def timed(function, repeat):
+    """Median and max wall time of function() in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {'median_ms': statistics.median(samples), 'max_ms': max(samples)}
+
+
+def bench_persistence(backend, repeat):
+    """load_data/save_data cost for each history size"""
+    results = {}
+    for label, days in HISTORY_SIZES.items():
+        workdir = tempfile.mkdtemp(prefix="study_timer_bench_")
+        try:
+            data_file = os.path.join(workdir, "data.json")
+            history = synthetic_history(days)
+            with open(data_file, 'w') as f:
+                json.dump(history, f, indent=2)
+            storage = open_storage(data_file, backend)
+            if backend == "sqlite":
+                storage.save_days(sorted(history.items()))
+
+            def load():
+                engine = StudyEngine(storage=storage)
+                engine.load_data()
+
+            engine = StudyEngine(storage=storage)
+            engine.load_data()
+
+            def save():
+                # Saves store only new study time, so credit a minute each time
+                engine.total_study_time += 1
+                engine.save_data()
+
+            save_cost = timed(save, repeat)
+
+            # The app saves through the write-behind queue; this is what the UI thread pays
+            engine.storage = WriteBehindStorage(storage)
+            queued_save = timed(save, repeat)
+            engine.storage.close()
+
+            results[label] = {
+                'days': len(history),
+                'data_file_bytes': os.path.getsize(data_file),
+                'load_data': timed(load, max(1, repeat // 10)),
+                'save_data': save_cost,
+                'save_data_queued': queued_save,
+            }
+            if backend == "sqlite":
+                storage.close()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def bench_sync(repeat):
+    """Sync cost against a local stand-in server: first sync, one changed day, nothing changed"""
+    server = make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    results = {}
+    try:
+        for label, days in HISTORY_SIZES.items():
+            workdir = tempfile.mkdtemp(prefix="study_timer_bench_")
+            try:
+                history = synthetic_history(days, seed=len(results))
+                storage = open_storage(os.path.join(workdir, "data.json"), "json", synced=False)
+                storage.add_days(sorted(history.items()))
+                storage.compact()  # archive old days up front, as the app has long since done
+                state = SyncState(os.path.join(workdir, "sync.json"))
+                state.use_server(url)
+                client = SyncClient(url)
+                first = sync(storage, state, client)
+
+                def sync_once(change):
+                    if change:
+                        storage.add(date.today().isoformat(), {'session_count': 1, 'total_study_time': 25,
+                                                               'last_updated': datetime.now().isoformat()})
+                    client.requests = client.bytes_sent = client.bytes_received = 0
+                    return sync(storage, state, client)
+
+                one_day = [sync_once(True) for _ in range(repeat)]
+                unchanged = [sync_once(False) for _ in range(repeat)]
+                client.close()
+                storage.close()
+                results[label] = {
+                    'days': len(history),
+                    'first_sync': first,
+                    'one_changed_day': {
+                        'median_ms': statistics.median(r['seconds'] for r in one_day) * 1000,
+                        'bytes_sent': one_day[-1]['bytes_sent'],
+                        'requests': one_day[-1]['requests'],
+                    },
+                    'unchanged': {
+                        'median_ms': statistics.median(r['seconds'] for r in unchanged) * 1000,
+                        'bytes_sent': unchanged[-1]['bytes_sent'],
+                        'requests': unchanged[-1]['requests'],
+                    },
+                }
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def bench_events(years, repeat):
+    """Size of the per-session event log and the cost of scanning it"""
+    workdir = tempfile.mkdtemp(prefix="study_timer_bench_")
+    try:
+        path = os.path.join(workdir, "events.bin")
+        events = EventStore(path)
+        start_date = date(2025, 1, 1)
+        simulate(years * 365, events=events, start_date=start_date)
+        month_start = (start_date + timedelta(days=years * 365 // 2)).replace(day=1)
+        month_end = (month_start + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+        full_scan = timed(events.summary, repeat)
+        file_bytes = os.path.getsize(path)
+        results = {
+            'years': years,
+            'records': len(events),
+            'file_bytes': file_bytes,
+            'index_bytes': os.path.getsize(events.index_path),
+            'full_scan': full_scan,
+            'full_scan_mb_per_s': file_bytes / 1e6 / (full_scan['median_ms'] / 1000),
+            'month_lookup': timed(lambda: events.between(month_start.isoformat(), month_end.isoformat()),
+                                  repeat),
+        }
+        events.close()
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_charts(repeat):
+    """Time to render each stats window zoom level over 10 years of history, cold and cached"""
+    analytics = StudyAnalytics(synthetic_history(HISTORY_SIZES['5_years'] * 2))
+    today = date.today()
+    results = {}
+    for granularity in GRANULARITIES:
+        view = ChartView(granularity, '10_years', 600, 140)
+        rendered = queue.SimpleQueue()  # stands in for the Tk event queue
+        renderer = ChartRenderer(analytics, rendered.put)
+        renderer.get(view, today)
+        renderer.store(rendered.get())
+        results[granularity] = {
+            'cold': timed(lambda: render(HistorySnapshot(analytics, today), view), repeat),
+            'cached': timed(lambda: renderer.get(view, today), repeat),
+        }
+        renderer.close()
+    return results
+
+
+def bench_drift(seconds, visible=True):
+    """Run the TimerWorker tick schedule for real and measure how far it drifts and how often it wakes"""
+    countdown = DeadlineTimer()
+    ticks = queue.SimpleQueue()  # stands in for the Tk event queue
+    worker = TimerWorker(countdown, lambda *tick: ticks.put(tick))
+    worker.set_visible(visible)
+    countdown.start(seconds)
+    started = time.perf_counter()
+    worker.start()
+    while True:
+        _, scheduled, _ = ticks.get()
+        countdown.record_tick(scheduled)
+        if countdown.remaining() <= 0:
+            break
+    countdown.record_completion()
+    worker.close()
+    report = countdown.drift.report()
+    report['requested_seconds'] = seconds
+    report['elapsed_seconds'] = time.perf_counter() - started
+    report['wakeups'] = worker.wakeups
+    report['wakeups_per_hour'] = worker.wakeups / report['elapsed_seconds'] * 3600
+    return report
+
+
+def bench_button_latency(repeat):
+    """Time from each button handler call until Tk has redrawn"""
+    if not has_display():
+        return {'skipped': "no display; run under xvfb-run"}
+
+    from study_timer import StudyTimer
+
+    workdir = tempfile.mkdtemp(prefix="study_timer_bench_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        app = StudyTimer()
+        app.root.update()
+        handlers = {'toggle_timer': [], 'start_break_timer': [], 'reset_timer': []}
+        for _ in range(repeat):
+            # Start a study session, switch to the break, then reset
+            for name in ('toggle_timer', 'start_break_timer', 'reset_timer'):
+                started = time.perf_counter()
+                getattr(app, name)()
+                app.root.update_idletasks()
+                handlers[name].append((time.perf_counter() - started) * 1000)
+        app.on_closing()
+        return {name: {'median_ms': statistics.median(samples), 'max_ms': max(samples)}
+                for name, samples in handlers.items()}
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_cold_start(runs):
+    if not has_display():
+        return {'skipped': "no display; run under xvfb-run"}
+    workdir = tempfile.mkdtemp(prefix="study_timer_bench_")
+    try:
+        samples = [run_cold_start(workdir) for _ in range(runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'runs': runs,
+        'median_first_frame_ms': statistics.median(s['first_frame_ms'] for s in samples),
+        'median_process_wall_ms': statistics.median(s['process_wall_ms'] for s in samples),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default="bench_output.json", help="where to write the results")
+    parser.add_argument("--repeat", type=int, default=50, help="samples per persistence/latency measurement")
+    parser.add_argument("--event-years", type=int, default=20, help="simulated years of session events")
+    parser.add_argument("--drift-seconds", type=float, default=60.0, help="length of the real-time drift run")
+    parser.add_argument("--startup-runs", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="short drift run and fewer samples")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.repeat, args.drift_seconds, args.startup_runs, args.event_years = 10, 5.0, 2, 2
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'persistence': {backend: bench_persistence(backend, args.repeat) for backend in ("json", "sqlite")},
+        'sync': bench_sync(max(1, args.repeat // 5)),
+        'events': bench_events(args.event_years, args.repeat),
+        'charts': bench_charts(args.repeat),
+        'drift': bench_drift(args.drift_seconds),
+        'drift_hidden': bench_drift(args.drift_seconds, visible=False),
+        'button_latency': bench_button_latency(args.repeat),
+        'cold_start': bench_cold_start(args.startup_runs),
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Concurrent Writer Stress Test
+Runs many processes saving study time into one data directory at once,
+with aggressive journal compaction and a concurrent reader, then checks
+that the stored totals add up to exactly what the writers credited.
+Exits non-zero if any update was lost or counted twice
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from journal import SessionJournal
+from storage import SqliteStorage, WriteBehindStorage, sqlite_path
+from timer_engine import StudyEngine
+
+DAYS = ("2025-03-01", "2025-03-02", "2025-03-03")
+MINUTES_PER_SAVE = 25
+
+
+def open_backend(data_file, backend):
+    if backend == "json":
+        # A tiny threshold makes every process compact constantly
+        return SessionJournal(data_file, compact_threshold=10)
+    return SqliteStorage(sqlite_path(data_file))
+
+
+def writer(data_file, backend, saves, write_behind, restart_every):
+    """Credit one session per save, restarting the engine now and then like a reopened window"""
+    storage = open_backend(data_file, backend)
+    if write_behind:
+        storage = WriteBehindStorage(storage)
+    engine = None
+    for i in range(saves):
+        day = DAYS[i % len(DAYS)]
+        if engine is None or engine.today != day or i % restart_every == 0:
+            engine = StudyEngine(storage=storage, today=day)
+            engine.load_data()
+        engine.session_count += 1
+        engine.total_study_time += MINUTES_PER_SAVE
+        engine.save_data()
+    if write_behind:
+        storage.close()
+
+
+def reader(data_file, backend, stop):
+    """Load the whole history in a loop, like a reporting script"""
+    storage = open_backend(data_file, backend)
+    loads = 0
+    while not stop.is_set():
+        storage.load()
+        loads += 1
+    return loads
+
+
+def run(backend, processes, saves, write_behind, restart_every):
+    workdir = tempfile.mkdtemp(prefix="study_timer_stress_")
+    try:
+        data_file = os.path.join(workdir, "data.json")
+        stop = multiprocessing.Event()
+        watcher = multiprocessing.Process(target=reader, args=(data_file, backend, stop))
+        workers = [multiprocessing.Process(target=writer,
+                                           args=(data_file, backend, saves, write_behind, restart_every))
+                   for _ in range(processes)]
+
+        started = time.perf_counter()
+        watcher.start()
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+        stop.set()
+        watcher.join()
+        elapsed = time.perf_counter() - started
+
+        failed = [p.exitcode for p in workers + [watcher] if p.exitcode != 0]
+        if failed:
+            print(f"{backend}: {len(failed)} process(es) crashed")
+            return False
+
+        if backend == "json":
+            SessionJournal(data_file).compact()  # the final fold must not change the totals
+        history = open_backend(data_file, backend).load()
+
+        expected = {day: 0 for day in DAYS}
+        for i in range(saves):
+            expected[DAYS[i % len(DAYS)]] += processes
+        ok = True
+        for day, sessions in expected.items():
+            record = history.get(day, {})
+            got_sessions = record.get('session_count', 0)
+            got_minutes = record.get('total_study_time', 0)
+            if got_sessions != sessions or got_minutes != sessions * MINUTES_PER_SAVE:
+                print(f"{backend}: {day} has {got_sessions} sessions / {got_minutes} minutes, "
+                      f"expected {sessions} / {sessions * MINUTES_PER_SAVE}")
+                ok = False
+
+        mode = "write-behind" if write_behind else "direct"
+        status = "ok" if ok else "LOST UPDATES"
+        print(f"{backend} ({mode}): {processes} processes x {saves} saves in {elapsed:.2f}s - {status}")
+        return ok
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--saves", type=int, default=200, help="saves per writer process")
+    parser.add_argument("--restart-every", type=int, default=25,
+                        help="saves between engine restarts in each writer")
+    parser.add_argument("--backend", choices=("json", "sqlite", "all"), default="all")
+    args = parser.parse_args()
+
+    backends = ("json", "sqlite") if args.backend == "all" else (args.backend,)
+    ok = True
+    for backend in backends:
+        for write_behind in (False, True):
+            ok = run(backend, args.processes, args.saves, write_behind, args.restart_every) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Charts
+Daily, weekly and yearly history charts for the stats window
+Period totals come straight from the analytics prefix sums, long ranges
+are downsampled to min/max/mean buckets a couple of pixels wide, and the
+canvas coordinates are computed on a background thread and cached per
+zoom level until the history changes
+"""
+
+import logging
+import threading
+import time
+from array import array
+from collections import namedtuple
+from datetime import date
+
+import metrics
+
+log = logging.getLogger("study_timer.charts")
+
+GRANULARITIES = ("day", "week", "year")
+# Days covered by each range; None is the whole history
+SPANS = {'month': 31, 'year': 366, '10_years': 3653, 'all': None}
+PIXELS_PER_BUCKET = 2
+
+ChartView = namedtuple("ChartView", "granularity span width height")
+# band: polygon from each bucket's max down to its min; mean: step line through the means
+ChartShape = namedtuple("ChartShape", "band mean peak")
+RenderedChart = namedtuple("RenderedChart", "view key first_day last_day minutes sessions")
+
+
+class HistorySnapshot:
+    """Copy of the analytics prefix sums, safe to read from another thread"""
+
+    def __init__(self, analytics, today):
+        self.key = (analytics.version, today.toordinal())
+        self.today = today.toordinal()
+        self.first_day = analytics.first_day if analytics.first_day is not None else self.today
+        self.prefix_minutes = array('d', analytics.prefix_minutes)
+        self.prefix_sessions = array('d', analytics.prefix_sessions)
+
+    def total(self, prefix, start, end):
+        """Sum of the days [start, end) (ordinals); days outside the history count as 0"""
+        last = len(prefix) - 1
+        start = min(max(start - self.first_day, 0), last)
+        end = min(max(end - self.first_day, 0), last)
+        return prefix[end] - prefix[start]
+
+
+def period_starts(first, end, granularity):
+    """Ordinals starting each day, Monday-based week or calendar year in [first, end)"""
+    if granularity == "day":
+        return list(range(first, end))
+    if granularity == "week":
+        return list(range(first - (first - 1) % 7, end, 7))  # ordinal 1 is a Monday
+    years = range(date.fromordinal(first).year, date.fromordinal(end - 1).year + 1)
+    return [date(year, 1, 1).toordinal() for year in years]
+
+
+def downsample(values, buckets):
+    """(min, max, mean) of each of at most `buckets` runs of consecutive values"""
+    count = min(len(values), buckets)
+    result = []
+    for i in range(count):
+        chunk = values[i * len(values) // count:(i + 1) * len(values) // count]
+        result.append((min(chunk), max(chunk), sum(chunk) / len(chunk)))
+    return result
+
+
+def chart_shape(buckets, width, height):
+    """Canvas coordinates for one chart of the given size, origin at its top left"""
+    peak = max((high for _, high, _ in buckets), default=0.0)
+    scale = height / peak if peak > 0 else 0.0
+    step = width / len(buckets) if buckets else 0.0
+    top, bottom, mean = [], [], []
+    for i, (low, high, average) in enumerate(buckets):
+        left, right = i * step, (i + 1) * step
+        top += (left, height - high * scale, right, height - high * scale)
+        bottom += (left, height - low * scale, right, height - low * scale)
+        mean += (left, height - average * scale, right, height - average * scale)
+    # Walk the maxima left to right and the minima back, closing the band
+    band = top
+    for i in range(len(bottom) - 2, -1, -2):
+        band += (bottom[i], bottom[i + 1])
+    return ChartShape(band, mean, peak)
+
+
+def render(snapshot, view):
+    """Both charts of a view as a RenderedChart"""
+    end = snapshot.today + 1
+    first = min(snapshot.first_day, snapshot.today)
+    span = SPANS[view.span]
+    if span is not None:
+        first = max(first, end - span)
+    starts = period_starts(first, end, view.granularity)
+    bounds = starts + [end]
+    buckets = max(1, view.width // PIXELS_PER_BUCKET)
+    charts = []
+    for prefix in (snapshot.prefix_minutes, snapshot.prefix_sessions):
+        totals = [snapshot.total(prefix, start, stop) for start, stop in zip(bounds, bounds[1:])]
+        charts.append(chart_shape(downsample(totals, buckets), view.width, view.height))
+    return RenderedChart(view, snapshot.key, starts[0], end - 1, *charts)
+
+
+class ChartRenderer:
+    """Renders chart views on one background thread and caches them per zoom level
+
+    get() and store() are called on the Tk thread only; the worker thread
+    sees nothing but HistorySnapshots
+    """
+
+    def __init__(self, analytics, post):
+        self.analytics = analytics
+        self.post = post  # called on the worker thread with each finished RenderedChart
+        self.cache = {}  # ChartView -> RenderedChart for cache_key
+        self.cache_key = None
+        self._cond = threading.Condition()
+        self._pending = None
+        self._closed = False
+        self._thread = None
+
+    def current_key(self, today=None):
+        """Identifies the history a rendering was made from: analytics version and day"""
+        return (self.analytics.version, (today or date.today()).toordinal())
+
+    def get(self, view, today=None):
+        """The cached rendering of view, or None after asking the worker for it"""
+        snapshot_key = self.current_key(today)
+        if snapshot_key != self.cache_key:
+            self.cache.clear()
+            self.cache_key = snapshot_key
+        rendered = self.cache.get(view)
+        if rendered is None:
+            self.request(HistorySnapshot(self.analytics, today or date.today()), view)
+        return rendered
+
+    def store(self, rendered):
+        """Keep a finished rendering; False if the history changed while it was drawn"""
+        if rendered.key != self.cache_key:
+            return False
+        self.cache[rendered.view] = rendered
+        return True
+
+    def request(self, snapshot, view):
+        """Render view in the background; replaces any request not yet started"""
+        with self._cond:
+            self._pending = (snapshot, view, time.perf_counter())
+            self._cond.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending is not None or self._closed)
+                if self._closed:
+                    return
+                snapshot, view, requested = self._pending
+                self._pending = None
+            try:
+                rendered = render(snapshot, view)
+            except Exception:
+                log.exception("Error rendering the %s/%s chart", view.granularity, view.span)
+                continue
+            metrics.CHART_RENDER.observe(time.perf_counter() - requested)
+            self.post(rendered)
+
+
+class StatsWindow:
+    """Toplevel with minutes and sessions charts over a chosen period and range"""
+
+    WIDTH = 600
+    PLOT_HEIGHT = 140
+    LEFT = 20
+    TOP = 30
+    ROW_HEIGHT = 190  # plot plus its title and date labels
+    CHARTS = (('minutes', "Minutes studied"), ('sessions', "Sessions"))
+
+    def __init__(self, root, renderer, on_close=None):
+        import tkinter as tk
+        from tkinter import ttk
+
+        self.renderer = renderer
+        self.on_close = on_close
+        self.granularity = "day"
+        self.span = "year"
+        self.shown_key = None  # history the current view was requested for
+
+        self.window = tk.Toplevel(root)
+        self.window.title("Study History")
+        self.window.configure(bg='black')
+        self.window.resizable(False, False)
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        controls = ttk.Frame(self.window, padding="10")
+        controls.grid(row=0, column=0, sticky=(tk.W, tk.E))
+        for column, (granularity, text) in enumerate(zip(GRANULARITIES, ("Daily", "Weekly", "Yearly"))):
+            ttk.Button(controls, text=text,
+                       command=lambda g=granularity: self.show(granularity=g)).grid(row=0, column=column, padx=3)
+        for column, (span, text) in enumerate(zip(SPANS, ("Month", "Year", "10 Years", "All")), 4):
+            ttk.Button(controls, text=text,
+                       command=lambda s=span: self.show(span=s)).grid(row=0, column=column, padx=3)
+        controls.columnconfigure(3, minsize=20)
+
+        self.canvas = tk.Canvas(self.window, width=self.WIDTH + 2 * self.LEFT,
+                                height=self.TOP + 2 * self.ROW_HEIGHT - 20,
+                                bg='black', highlightthickness=0)
+        self.canvas.grid(row=1, column=0)
+        self.show()
+
+    def view(self):
+        return ChartView(self.granularity, self.span, self.WIDTH, self.PLOT_HEIGHT)
+
+    def show(self, granularity=None, span=None):
+        """Switch zoom level (or redraw the current one); draws at once when cached"""
+        self.granularity = granularity or self.granularity
+        self.span = span or self.span
+        self.shown_key = self.renderer.current_key()
+        rendered = self.renderer.get(self.view())
+        if rendered is not None:
+            self.draw(rendered)
+        else:
+            self.canvas.delete("status")
+            self.canvas.create_text(self.LEFT + self.WIDTH, 10, anchor='ne', text="Loading...",
+                                    fill='gray60', tags="status")
+
+    def refresh(self):
+        """Redraw if the history has changed since the view was shown"""
+        if self.renderer.current_key() != self.shown_key:
+            self.show()
+
+    def on_rendered(self, rendered):
+        """A background rendering finished; draw it if it is still the chosen view"""
+        current = self.renderer.store(rendered)
+        if rendered.view != self.view():
+            return
+        if current:
+            self.draw(rendered)
+        else:
+            self.show()  # the history changed meanwhile
+
+    def draw(self, rendered):
+        canvas = self.canvas
+        canvas.delete("all")
+        first = date.fromordinal(rendered.first_day).isoformat()
+        last = date.fromordinal(rendered.last_day).isoformat()
+        for row, (name, title) in enumerate(self.CHARTS):
+            shape = getattr(rendered, name)
+            top = self.TOP + row * self.ROW_HEIGHT
+            canvas.create_text(self.LEFT, top - 6, anchor='sw', fill='white', font=("Arial", 11, "bold"),
+                               text=f"{title} per {self.granularity} (peak {shape.peak:.1f})")
+            canvas.create_rectangle(self.LEFT, top, self.LEFT + self.WIDTH, top + self.PLOT_HEIGHT,
+                                    outline='gray25')
+            plot = f"plot{row}"
+            canvas.create_polygon(*shape.band, fill='gray30', outline='', tags=plot)
+            canvas.create_line(*shape.mean, fill='white', tags=plot)
+            canvas.move(plot, self.LEFT, top)
+            canvas.create_text(self.LEFT, top + self.PLOT_HEIGHT + 4, anchor='nw', fill='gray60', text=first)
+            canvas.create_text(self.LEFT + self.WIDTH, top + self.PLOT_HEIGHT + 4, anchor='ne',
+                               fill='gray60', text=last)
+
+    def lift(self):
+        self.window.deiconify()
+        self.window.lift()
+
+    def close(self):
+        self.window.destroy()
+        if self.on_close is not None:
+            self.on_close()
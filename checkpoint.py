@@ -0,0 +1,151 @@
+"""
+Session Checkpoint
+Crash-safe record of the study session in progress
+Each running instance keeps one fixed-size record (the session's day,
+start time and a heartbeat) in data/checkpoint-<id>.bin, overwritten in
+place and locked for as long as the instance is alive. On the next
+launch, checkpoints whose lock can be taken belong to instances that died
+mid-session, and their study time up to the last heartbeat is credited
+"""
+
+import glob
+import os
+import struct
+import threading
+import uuid
+from collections import namedtuple
+from datetime import date
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MAGIC = b"STCP"
+VERSION = 1
+# magic, version, record size, day ordinal, active, session start, last heartbeat, study duration (minutes)
+RECORD = struct.Struct("<4sHHIBxxxddd")
+
+InterruptedSession = namedtuple("InterruptedSession", "day start last_alive study_duration")
+
+
+def _try_lock(fd):
+    """Take an exclusive lock on fd without waiting; False if another process holds it"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+class SessionCheckpoint:
+    """This instance's checkpoint file, held locked until close()
+
+    Cleared from the storage writer's thread once a credit is on disk, so
+    updates are serialised by a lock
+    """
+
+    def __init__(self, directory, interval=10.0):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.interval = interval  # minimum seconds between heartbeat writes
+        self.path = os.path.join(directory, f"checkpoint-{os.getpid()}-{uuid.uuid4().hex[:8]}.bin")
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        _try_lock(self._fd)
+        self.active = False
+        self._day = 0
+        self._start = 0.0
+        self._study_duration = 0.0
+        self._last_alive = 0.0
+        self._write(0.0, sync=True)
+
+    def begin(self, day, start, study_duration):
+        """A study session started at start (unix time) on day (ISO date)"""
+        with self._lock:
+            self.active = True
+            self._day = date.fromisoformat(day).toordinal()
+            self._start = start
+            self._study_duration = study_duration
+            self._write(start, sync=True)
+
+    def heartbeat(self, now, force=False):
+        """Record that the session was still running at now (at most once per interval)"""
+        with self._lock:
+            if self.active and (force or now - self._last_alive >= self.interval):
+                self._write(now, sync=True)
+
+    def clear(self, start=None):
+        """The session (the one started at start, if given) was credited and saved; nothing to recover"""
+        with self._lock:
+            if self._fd is not None and self.active and (start is None or start == self._start):
+                self.active = False
+                self._write(0.0, sync=True)
+
+    def close(self):
+        """Let go of the checkpoint on exit
+
+        It is removed unless a session is still active, i.e. its credit never
+        reached the disk, in which case the next launch recovers it
+        """
+        with self._lock:
+            os.close(self._fd)
+            self._fd = None
+            if not self.active:
+                os.remove(self.path)
+
+    def _write(self, last_alive, sync):
+        record = RECORD.pack(MAGIC, VERSION, RECORD.size, self._day, self.active,
+                             self._start, last_alive, self._study_duration)
+        # One small in-place write; the file never grows or moves
+        _write_at_start(self._fd, record, sync)
+        self._last_alive = last_alive
+
+    def recover(self):
+        """InterruptedSessions left behind by other, dead instances"""
+        return recover(self.directory)
+
+
+def _write_at_start(fd, data, sync):
+    if hasattr(os, "pwrite"):
+        os.pwrite(fd, data, 0)
+    else:  # Windows
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, data)
+    if sync:
+        os.fdatasync(fd) if hasattr(os, "fdatasync") else os.fsync(fd)
+
+
+def recover(directory):
+    """Collect and remove checkpoints left behind by dead instances
+
+    Returns the InterruptedSessions whose time has not been credited yet
+    """
+    sessions = []
+    for path in glob.glob(os.path.join(glob.escape(directory), "checkpoint-*.bin")):
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            continue  # another instance recovered it first
+        try:
+            if not _try_lock(fd):
+                continue  # its instance is still running
+            data = os.read(fd, RECORD.size)
+            if len(data) == RECORD.size:
+                magic, version, size, day, active, start, last_alive, study_duration = RECORD.unpack(data)
+                if magic == MAGIC and version == VERSION and size == RECORD.size and active:
+                    sessions.append(InterruptedSession(date.fromordinal(day).isoformat(), start,
+                                                       last_alive, study_duration))
+                    # Mark it recovered before letting go, so nobody credits it twice
+                    _write_at_start(fd, RECORD.pack(magic, version, size, day, False, start,
+                                                    last_alive, study_duration), sync=True)
+        finally:
+            os.close(fd)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return sessions
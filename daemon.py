@@ -0,0 +1,186 @@
+"""
+Timer Daemon
+Headless study timer controlled over a Unix socket
+One StudyEngine is driven by the asyncio loop (a single pending
+call_later) and saves to the usual data directory. Every state change is
+published to the memory-mapped status file for status bars and prompts
+"""
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+
+from analytics import StudyAnalytics
+from checkpoint import SessionCheckpoint
+from events import EventStore, events_path
+from status import StatusPublisher, status_path
+from storage import WriteBehindStorage, open_storage
+from timer_engine import StudyEngine
+from timer_server import MAX_SLEEP, JsonLineServer
+
+log = logging.getLogger("study_timer.daemon")
+
+SAVE_FLUSH_TIMEOUT = 3.0
+PRESETS = {'25_5': (25, 5), '50_10': (50, 10)}
+
+
+def socket_path(data_file):
+    """data/data.json -> data/study_timer.sock"""
+    return os.path.join(os.path.dirname(data_file), "study_timer.sock")
+
+
+class TimerDaemon(JsonLineServer):
+    """Line-delimited JSON control API for one headless timer"""
+
+    def __init__(self, engine, status):
+        self.engine = engine
+        self.status = status
+        self._expiry = None  # asyncio.TimerHandle for the running countdown
+        self.commands = {
+            'start': self.start,
+            'pause': self.pause,
+            'toggle': self.toggle,
+            'reset': self.reset,
+            'break': self.start_break,
+            'study': self.start_study,
+            'preset': self.preset,
+            'status': self.query,
+        }
+
+    def start(self):
+        self.engine.start()
+        self._changed()
+
+    def pause(self):
+        self.engine.pause()
+        self._changed()
+
+    def toggle(self):
+        """Pause a running countdown, otherwise start it"""
+        if self.engine.is_running:
+            self.pause()
+        else:
+            self.start()
+
+    def reset(self):
+        self.engine.reset()
+        self._changed()
+
+    def start_break(self):
+        self.engine.start_break()
+        self._changed()
+
+    def start_study(self):
+        self.engine.start_study()
+        self._changed()
+
+    def preset(self, name=None, study_duration=None, break_duration=None):
+        """Switch to a named preset (25_5, 50_10) or explicit minutes; refused while running"""
+        if name is not None:
+            study_duration, break_duration = PRESETS[name]
+        if not self.engine.set_durations(study_duration, break_duration):
+            raise RuntimeError("pause the timer before changing the preset")
+        self.reset()
+
+    def query(self):
+        engine = self.engine
+        return {
+            'mode': 'study' if engine.is_study_time else 'break',
+            'running': engine.is_running,
+            'time_remaining': engine.countdown.remaining() if engine.is_running else engine.time_remaining,
+            'study_duration': engine.study_duration,
+            'break_duration': engine.break_duration,
+            'session_count': engine.session_count,
+            'total_study_time': engine.total_study_time,
+        }
+
+    def _changed(self):
+        """Reschedule the expiry callback and republish the status record"""
+        if self._expiry is not None:
+            self._expiry.cancel()
+            self._expiry = None
+        if self.engine.is_running:
+            loop = asyncio.get_running_loop()
+            self._expiry = loop.call_later(min(self.engine.countdown.remaining(), MAX_SLEEP), self._expire)
+        self.status.publish(self.engine)
+
+    def _expire(self):
+        self._expiry = None
+        self.engine.heartbeat()
+        if self.engine.tick():
+            self.engine.complete()
+            self._changed()
+        else:
+            self._expiry = asyncio.get_running_loop().call_later(
+                min(self.engine.countdown.remaining(), MAX_SLEEP), self._expire)
+
+
+async def run_daemon(data_file):
+    os.makedirs(os.path.dirname(data_file), exist_ok=True)
+    path = socket_path(data_file)
+    if os.path.exists(path):
+        # Refuse to steal the socket from a daemon that is still running
+        probe = socket.socket(socket.AF_UNIX)
+        try:
+            probe.connect(path)
+            raise SystemExit(f"Another timer daemon is listening on {path}")
+        except ConnectionRefusedError:
+            os.remove(path)
+        finally:
+            probe.close()
+
+    storage = WriteBehindStorage(open_storage(data_file))
+    engine = StudyEngine(storage=storage, analytics=StudyAnalytics(),
+                         events=EventStore(events_path(data_file)),
+                         checkpoint=SessionCheckpoint(os.path.dirname(data_file)))
+    engine.load_data()
+    status = StatusPublisher(status_path(data_file))
+    daemon = TimerDaemon(engine, status)
+    status.publish(engine)
+
+    listener = await asyncio.start_unix_server(daemon.handle_connection, path)
+    os.chmod(path, 0o600)  # only the owner may control the timer
+    print(f"Timer daemon listening on {path}")
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+    try:
+        async with listener:
+            await stopped.wait()
+    finally:
+        engine.pause()
+        engine.add_partial_session_time()
+        engine.save_data()
+        if not storage.close(timeout=SAVE_FLUSH_TIMEOUT):
+            log.warning("Some study data could not be written before exiting")
+        # Only now, so a session whose credit was not written is kept for recovery
+        engine.checkpoint.close()
+        status.publish(engine)
+        status.close()
+        os.remove(path)
+
+
+def run(data_file):
+    """Run the daemon until SIGINT/SIGTERM"""
+    if not hasattr(socket, "AF_UNIX"):
+        raise SystemExit("The daemon needs Unix domain sockets; use 'serve' on this platform")
+    asyncio.run(run_daemon(data_file))
+
+
+def send_command(data_file, request):
+    """Send one request to a running daemon and return its decoded response"""
+    with socket.socket(socket.AF_UNIX) as client:
+        client.connect(socket_path(data_file))
+        client.sendall(json.dumps(request).encode() + b"\n")
+        reply = b""
+        while not reply.endswith(b"\n"):
+            chunk = client.recv(4096)
+            if not chunk:
+                break
+            reply += chunk
+    return json.loads(reply)
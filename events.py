@@ -0,0 +1,212 @@
+"""
+Session Events
+Compact binary log of every study and break interval
+Each interval is one fixed-width 12-byte record (start, duration, kind,
+outcome, planned length) appended to data/events.bin, so twenty years of
+sessions take a couple of MB. Reads go through a memory map, and a small
+per-day index of record numbers turns date-range lookups into one slice
+"""
+
+import functools
+import mmap
+import os
+import struct
+from array import array
+from collections import namedtuple
+from datetime import date, datetime
+
+from analytics import load_numpy
+from journal import file_lock
+
+MAGIC = b"STEV"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")  # magic, version, record size
+# start (unix seconds), duration (ms), kind, completed, planned length (seconds)
+RECORD = struct.Struct("<IIBBH")
+INDEX_HEADER = struct.Struct("<II")  # first day ordinal, records covered
+
+STUDY_EVENT = 0
+BREAK_EVENT = 1
+
+
+@functools.lru_cache(maxsize=None)
+def record_dtype():
+    """RECORD as a numpy structured dtype"""
+    return load_numpy().dtype([('start', '<u4'), ('duration_ms', '<u4'), ('kind', 'u1'),
+                               ('completed', 'u1'), ('planned', '<u2')])
+
+
+SessionEvent = namedtuple("SessionEvent", "start duration_ms kind completed planned")
+
+
+def events_path(data_file):
+    """data/data.json -> data/events.bin"""
+    return os.path.join(os.path.dirname(data_file), "events.bin")
+
+
+def day_ordinal(timestamp):
+    """Local calendar day of a unix timestamp, as a date ordinal"""
+    return datetime.fromtimestamp(timestamp).toordinal()
+
+
+class EventStore:
+    """Append-only fixed-width event records with a per-day index"""
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.lock_file = path + ".lock"
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        with open(path, 'rb') as f:
+            magic, version, record_size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError(f"{path} is not a version {VERSION} event file")
+
+        self._mm = None
+        self._mapped_size = 0
+        # day_index[d] is the number of the first record starting on or after
+        # day first_day + d; records are appended in time order
+        self.first_day = None
+        self.day_index = array('I')
+        self.indexed = 0  # records covered by day_index
+        self._load_index()
+
+    def __len__(self):
+        return (os.path.getsize(self.path) - HEADER.size) // RECORD.size
+
+    def append(self, start, duration, kind, completed, planned):
+        """Record one interval: start (unix time), duration and planned length in seconds"""
+        record = RECORD.pack(int(start), int(round(duration * 1000)), kind, int(completed),
+                             min(int(round(planned)), 0xFFFF))
+        with file_lock(self.lock_file):
+            with open(self.path, 'ab') as f:
+                # Records are fixed width, so a torn final write is simply not counted
+                offset = f.tell() - HEADER.size
+                if offset % RECORD.size:
+                    f.truncate(HEADER.size + offset - offset % RECORD.size)
+                f.write(record)
+        if self._index_records(len(self)):
+            self._save_index()
+
+    def between(self, start_day, end_day):
+        """SessionEvents that started on start_day..end_day (ISO dates), in order"""
+        return [SessionEvent(*fields) for fields in self.scan(start_day, end_day)]
+
+    def scan(self, start_day=None, end_day=None):
+        """Raw records for a date range: a numpy structured array when available, else tuples"""
+        first, last = self._record_range(start_day, end_day)
+        mm = self._map()
+        offset = HEADER.size + first * RECORD.size
+        # Without numpy (in requirements.txt) scans fall back to struct.iter_unpack, ~10x slower
+        numpy = load_numpy()
+        if numpy is not None:
+            return numpy.frombuffer(mm, dtype=record_dtype(), count=last - first, offset=offset)
+        return list(RECORD.iter_unpack(memoryview(mm)[offset:offset + (last - first) * RECORD.size]))
+
+    def summary(self, start_day=None, end_day=None):
+        """Counts and averages over the recorded intervals in a date range"""
+        records = self.scan(start_day, end_day)
+        numpy = load_numpy()
+        if numpy is not None:
+            # Masked reductions over the field views; no study records are copied out
+            kinds = records['kind']
+            is_study = kinds == STUDY_EVENT
+            study_count = int(numpy.count_nonzero(is_study))
+            completed = int(numpy.count_nonzero((records['completed'] != 0) & is_study))
+            study_seconds = float(records['duration_ms'].sum(where=is_study, dtype=numpy.uint64)) / 1000
+            breaks = int(numpy.count_nonzero(kinds == BREAK_EVENT))
+        else:
+            study = [r for r in records if r[2] == STUDY_EVENT]
+            study_count = len(study)
+            completed = sum(r[3] for r in study)
+            study_seconds = sum(r[1] for r in study) / 1000
+            breaks = len(records) - study_count
+        return {
+            'study_intervals': study_count,
+            'completed_intervals': completed,
+            'completion_rate': completed / study_count if study_count else 0.0,
+            'mean_study_minutes': study_seconds / 60 / study_count if study_count else 0.0,
+            'breaks': breaks,
+        }
+
+    def close(self):
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass  # arrays from scan() still point into it; it closes when they go
+            self._mm = None
+
+    def _map(self):
+        """Memory map the file, remapping after it has grown"""
+        size = os.path.getsize(self.path)
+        if self._mm is None or size != self._mapped_size:
+            # The old map is dropped rather than closed, since arrays returned by
+            # scan() may still view it
+            with open(self.path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapped_size = size
+        return self._mm
+
+    def _record_range(self, start_day, end_day):
+        """[first, last) record numbers for the days start_day..end_day"""
+        self._index_records(len(self))
+        if self.first_day is None:
+            return 0, 0
+        first = 0
+        last = self.indexed
+        if start_day is not None:
+            first = self._first_record(date.fromisoformat(start_day).toordinal())
+        if end_day is not None:
+            last = self._first_record(date.fromisoformat(end_day).toordinal() + 1)
+        return first, max(first, last)
+
+    def _first_record(self, ordinal):
+        position = ordinal - self.first_day
+        if position <= 0:
+            return 0
+        if position >= len(self.day_index):
+            return self.indexed
+        return self.day_index[position]
+
+    def _index_records(self, count):
+        """Extend the day index over records [indexed, count); True if a new day was added"""
+        if count <= self.indexed:
+            return False
+        mm = self._map()
+        days_before = len(self.day_index)
+        start = HEADER.size + self.indexed * RECORD.size
+        for number, fields in enumerate(RECORD.iter_unpack(mm[start:HEADER.size + count * RECORD.size]),
+                                        self.indexed):
+            ordinal = day_ordinal(fields[0])
+            if self.first_day is None:
+                self.first_day = ordinal
+            # A record from before the current last day (clock change) stays in its append position
+            while self.first_day + len(self.day_index) <= ordinal:
+                self.day_index.append(number)
+        self.indexed = count
+        return len(self.day_index) != days_before
+
+    def _load_index(self):
+        """Read the saved index, then index any records appended after it was written"""
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+            if len(data) >= INDEX_HEADER.size:
+                first_day, indexed = INDEX_HEADER.unpack_from(data)
+                day_index = array('I', data[INDEX_HEADER.size:])
+                if indexed <= len(self) and (indexed == 0 or len(day_index)):
+                    self.first_day = first_day if indexed else None
+                    self.day_index = day_index
+                    self.indexed = indexed
+        self._index_records(len(self))
+
+    def _save_index(self):
+        """Write the index beside the events; it is rebuilt from the records if lost"""
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(INDEX_HEADER.pack(self.first_day or 0, self.indexed))
+            f.write(self.day_index.tobytes())
+        os.replace(tmp_path, self.index_path)
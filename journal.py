@@ -0,0 +1,438 @@
+"""
+Session Journal
+Append-only log of daily study totals that sits next to data.json
+Each save appends one short line; the journal is replayed on load and
+periodically folded back into data.json by a background compaction,
+which can also move days past the hot window into an archive (see
+retention.py), so data.json stays bounded.
+Saves are increments that add up on replay, and every file operation
+holds an advisory lock, so several processes can share one data file
+"""
+
+import glob
+import json
+import os
+import re
+import threading
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Snapshot key naming the last compacting journal folded into it
+FOLDED_KEY = "_folded"
+# Snapshot key holding how much of the history archive the snapshot has committed
+ARCHIVE_SIZE_KEY = "_archive_size"
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """Hold an advisory lock on path across processes and threads"""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            # flock locks belong to the open file, so threads in one process exclude each other too
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            # msvcrt has no shared locks, and LK_LOCK gives up after ten seconds
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def iter_json_object(f, chunk_size=1 << 16):
+    """Yield the (key, value) pairs of a JSON object read incrementally from a text file
+
+    Only one member is decoded at a time, so memory stays flat however
+    large the object is
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            position = WHITESPACE.match(buffer, position).end()
+            if position < len(buffer) or eof:
+                return
+            fill()
+
+    def decode():
+        nonlocal position
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(buffer) or eof:
+                    position = end
+                    return value
+            except ValueError:
+                if eof:
+                    raise
+            fill()
+
+    def expect(characters):
+        nonlocal position
+        skip_whitespace()
+        if position >= len(buffer) or buffer[position] not in characters:
+            raise ValueError(f"expected one of {characters!r} in JSON object")
+        position += 1
+        return buffer[position - 1]
+
+    expect("{")
+    skip_whitespace()
+    if position < len(buffer) and buffer[position] == "}":
+        return
+    while True:
+        skip_whitespace()
+        key = decode()
+        expect(":")
+        skip_whitespace()
+        yield key, decode()
+        if expect(",}") == "}":
+            return
+
+
+def add_record(current, increment):
+    """Add an increment record onto a day's totals (current may be None)"""
+    if current is None:
+        return dict(increment)
+    total = dict(current)
+    total['session_count'] = current.get('session_count', 0) + increment.get('session_count', 0)
+    total['total_study_time'] = current.get('total_study_time', 0) + increment.get('total_study_time', 0)
+    total['last_updated'] = max(filter(None, (current.get('last_updated'), increment.get('last_updated'))),
+                                default=None)
+    return total
+
+
+def apply_entry(current, entry):
+    """A day's record after applying one journal entry"""
+    if entry.pop('op', None) == "add":
+        return add_record(current, entry)
+    # Absolute daily totals (older journals): the latest one wins
+    return entry
+
+
+class SessionJournal:
+    def __init__(self, data_file, compact_threshold=500, archive=None):
+        self.data_file = data_file
+        base, _ = os.path.splitext(data_file)
+        self.journal_file = base + ".journal"
+        # Journals being folded into the snapshot are renamed to
+        # data.journal.compacting.<token>
+        self.compacting_prefix = base + ".journal.compacting"
+        # Guards the journal and snapshot; shared for reads, exclusive for writes
+        self.lock_file = base + ".lock"
+        # Held for a whole compaction so only one process compacts at a time
+        self.compact_lock_file = base + ".compact.lock"
+        self.compact_threshold = compact_threshold
+        # retention.HistoryArchive that compaction moves old days into; without
+        # one, days already archived are still kept track of but not read
+        self.archive = archive
+
+        self._pending_records = 0  # records this process appended since the last compaction
+        # Set when a load finds days past the hot window; they are archived on
+        # the next write, so read-only commands never start a compaction
+        self._archive_due = False
+        self._compact_thread = None
+
+    def load(self):
+        """Load every day from the snapshot with the journals replayed on top
+
+        Archived days are left out; iter_days() and load_all() include them
+        """
+        return self._load()[0]
+
+    def load_all(self):
+        """Every day, archived ones included"""
+        return dict(self.iter_days())
+
+    def rollups(self):
+        """Weekly and monthly totals of every day; needs an archive"""
+        all_data, archive_size = self._load()
+        return self.archive.summarise(all_data.items(), archive_size)
+
+    def _load(self):
+        """(days, committed archive size) from the snapshot and journals"""
+        with file_lock(self.lock_file, shared=True):
+            all_data = self._read_snapshot()
+            folded = all_data.pop(FOLDED_KEY, None)
+            archive_size = all_data.pop(ARCHIVE_SIZE_KEY, 0)
+            for path, token in self._compacting_files():
+                if token != folded:
+                    self._replay(path, all_data)
+            self._pending_records = self._replay(self.journal_file, all_data)
+        if self.archive is not None and self.archive.expired(all_data):
+            self._archive_due = True
+        return all_data, archive_size
+
+    def add(self, day, record):
+        """Add one day's increments to the journal"""
+        self.add_days([(day, record)])
+
+    def add_days(self, records):
+        """Append (day, increments) pairs in a single write; returns the bytes written
+
+        Records added by any process are summed on load, so concurrent
+        writers never overwrite each other
+        """
+        return self._write([dict(record, op="add", date=day) for day, record in records])
+
+    def save_days(self, records):
+        """Append (day, record) pairs that replace those days' totals; returns the bytes written"""
+        return self._write([dict(record, date=day) for day, record in records])
+
+    def _write(self, entries):
+        if not entries:
+            return 0
+        data = "".join(json.dumps(entry, separators=(',', ':')) + "\n" for entry in entries).encode()
+        with file_lock(self.lock_file):
+            with open(self.journal_file, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        self._pending_records += len(entries)
+
+        if self._pending_records >= self.compact_threshold or self._archive_due:
+            self.compact_in_background()
+        return len(data)
+
+    def days_between(self, start, end):
+        """(day, record) pairs for start <= day <= end, in date order"""
+        all_data, archive_size = self._load()
+        if self.archive is not None and archive_size and start < self.archive.cutoff():
+            # Reaches back before the hot window (a day studied again after it
+            # was archived is back in the snapshot, so the snapshot's oldest
+            # day says nothing); archived days come in date order
+            for day, record in self.archive.iter_days(archive_size):
+                if day > end:
+                    break
+                if day >= start:
+                    all_data[day] = add_record(record, all_data.get(day, {}))
+        return [(day, all_data[day]) for day in sorted(all_data) if start <= day <= end]
+
+    def changed_since(self, since):
+        """(day, record) pairs whose last_updated is at or after since (an ISO timestamp)
+
+        The archive keeps recently updated days hot, so only a since older
+        than its grace period has to read the archive
+        """
+        if self.archive is not None and since < self.archive.updated_cutoff():
+            days = self.iter_days()
+        else:
+            days = self._load()[0].items()
+        return [(day, record) for day, record in days if (record.get('last_updated') or "") >= since]
+
+    def iter_days(self):
+        """Yield every (day, record) without loading the whole snapshot
+
+        The journals are small and read up front; the snapshot is then
+        streamed from a handle opened under the lock, so a compaction that
+        replaces it meanwhile does not affect the export. Archived days
+        come first, in date order, streamed from the part of the archive
+        that snapshot committed
+        """
+        recent = {}  # day -> journal entries not yet in the snapshot, in order
+        with file_lock(self.lock_file, shared=True):
+            snapshot = open(self.data_file, 'r') if os.path.exists(self.data_file) else None
+            folded = None
+            archive_size = 0
+            if snapshot is not None:
+                # data.json is written with its markers last, so look for them at the end
+                folded = self._tail_marker(snapshot, FOLDED_KEY)
+                archive_size = self._tail_marker(snapshot, ARCHIVE_SIZE_KEY) or 0
+            for path, token in self._compacting_files():
+                if token != folded:
+                    for day, entry in self._read_journal(path):
+                        recent.setdefault(day, []).append(entry)
+            for day, entry in self._read_journal(self.journal_file):
+                recent.setdefault(day, []).append(entry)
+
+        # Archived bytes up to the committed size are never rewritten, so they
+        # can be read without the lock
+        merged = set()  # snapshot days already yielded with the archive
+        if self.archive is not None and archive_size:
+            # A snapshot day up to the last archived one may have been studied
+            # again after it was archived; those few are yielded once, summed,
+            # at their place among the archived days
+            last_day, _ = self.archive.order(archive_size)
+            revisited = {}
+            if snapshot is not None:
+                revisited = {day: record for day, record in iter_json_object(snapshot)
+                             if not day.startswith("_") and day <= last_day}
+                snapshot.seek(0)
+            merged = set(revisited)
+            for day, record in self.archive.iter_days(archive_size, revisited):
+                for entry in recent.pop(day, ()):
+                    record = apply_entry(record, entry)
+                yield day, record
+
+        if snapshot is not None:
+            with snapshot:
+                for day, record in iter_json_object(snapshot):
+                    if day in (FOLDED_KEY, ARCHIVE_SIZE_KEY) or day in merged:
+                        continue
+                    for entry in recent.pop(day, ()):
+                        record = apply_entry(record, entry)
+                    yield day, record
+        for day, entries in recent.items():
+            record = None
+            for entry in entries:
+                record = apply_entry(record, entry)
+            yield day, record
+
+    def compact_in_background(self):
+        """Fold the journal into the snapshot on a background thread"""
+        if self._compact_thread is not None and self._compact_thread.is_alive():
+            return
+        self._compact_thread = threading.Thread(target=self.compact, daemon=True)
+        self._compact_thread.start()
+
+    def compact(self):
+        """Fold the journal into the snapshot and start a fresh journal
+
+        With an archive, days past the hot window are then moved out of the
+        snapshot a batch per pass until none are left
+        """
+        while self._compact_pass():
+            pass
+        self._archive_due = False
+
+    def close(self, timeout=None):
+        """Wait for a background compaction to finish; False if the deadline passed
+
+        A compaction cut short is safe to redo, but waiting avoids redoing it
+        """
+        if self._compact_thread is not None:
+            self._compact_thread.join(timeout)
+            return not self._compact_thread.is_alive()
+        return True
+
+    def _compact_pass(self):
+        """One fold and archive pass; True if expired days remain for another"""
+        with file_lock(self.compact_lock_file):
+            # Rotate under the lock only briefly, so appends never wait on the rewrite
+            with file_lock(self.lock_file):
+                if os.path.exists(self.journal_file) and not self._compacting_files():
+                    os.replace(self.journal_file, f"{self.compacting_prefix}.{uuid.uuid4().hex}")
+            self._pending_records = 0
+
+            compacting = self._compacting_files()
+            if not compacting and self.archive is None:
+                return False
+
+            # Only the compactor rewrites the snapshot, so it can be read unlocked
+            all_data = self._read_snapshot()
+            folded = all_data.pop(FOLDED_KEY, None)
+            archive_size = all_data.pop(ARCHIVE_SIZE_KEY, 0)
+            for path, token in compacting:
+                if token != folded:
+                    self._replay(path, all_data)
+            if compacting:
+                folded = compacting[-1][1]
+
+            committed_size = archive_size
+            if self.archive is not None:
+                archive_size = self.archive.archive(all_data, archive_size)
+                if not compacting and archive_size == committed_size:
+                    return False  # nothing to fold or archive
+
+            # The snapshot commits both markers, written last so readers find
+            # them at the end. Naming the folded journal means a crash before it
+            # is removed cannot make the next load count its increments twice;
+            # the archive size means archived days count only once the days
+            # are gone from here
+            if archive_size:
+                all_data[ARCHIVE_SIZE_KEY] = archive_size
+            if folded is not None:
+                all_data[FOLDED_KEY] = folded
+
+            # Write to a temp file first so a crash never leaves a truncated snapshot
+            tmp_file = self.data_file + ".tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(all_data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+
+            with file_lock(self.lock_file):
+                os.replace(tmp_file, self.data_file)
+                for path, _ in compacting:
+                    os.remove(path)
+        return self.archive is not None and bool(self.archive.expired(all_data))
+
+    def _compacting_files(self):
+        """(path, token) for every journal waiting to be folded, oldest first"""
+        paths = sorted(glob.glob(glob.escape(self.compacting_prefix) + "*"), key=os.path.getmtime)
+        return [(path, path[len(self.compacting_prefix) + 1:]) for path in paths]
+
+    def _read_snapshot(self):
+        """Read the compacted snapshot (data.json)"""
+        if not os.path.exists(self.data_file):
+            return {}
+        with open(self.data_file, 'r') as f:
+            return json.load(f)
+
+    def _tail_marker(self, snapshot, key):
+        """Read a bookkeeping key from the end of an open snapshot, leaving it positioned at the start"""
+        snapshot.seek(0, os.SEEK_END)
+        size = snapshot.tell()
+        snapshot.seek(max(0, size - 4096))
+        tail = snapshot.read()
+        snapshot.seek(0)
+        marker = tail.rfind(f'"{key}"')
+        if marker == -1:
+            return None
+        try:
+            value, _ = json.JSONDecoder().raw_decode(tail[tail.index(":", marker) + 1:].lstrip())
+        except ValueError:
+            return None
+        return value
+
+    def _replay(self, path, all_data):
+        """Apply journal records from path onto all_data, returning the record count"""
+        count = 0
+        for day, entry in self._read_journal(path):
+            all_data[day] = apply_entry(all_data.get(day), entry)
+            count += 1
+        return count
+
+    def _read_journal(self, path):
+        """Yield (day, entry) for each intact line of a journal file"""
+        if not os.path.exists(path):
+            return
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-append is skipped
+                    continue
+                day = entry.pop('date', None)
+                if day is not None:
+                    yield day, entry
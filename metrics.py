@@ -0,0 +1,171 @@
+"""
+Metrics
+Hot-path instrumentation for the study timer
+Counters and histograms are always collected (a lock and a bisect per
+observation); they are exposed in Prometheus text format on a
+localhost-only HTTP port and optionally streamed to a JSONL trace file
+"""
+
+import bisect
+import json
+import threading
+import time
+
+# Latency buckets in seconds: 0.5 ms .. 5 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help_text}",
+                f"# TYPE {self.name} counter",
+                f"{self.name} {self.value}"]
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            label = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{self.name}_bucket{{le="{label}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+TICK_LAG = REGISTRY.histogram(
+    "study_timer_tick_lag_seconds",
+    "Delay between a tick's scheduled time and the display update that handled it")
+TK_QUEUE_DELAY = REGISTRY.histogram(
+    "study_timer_tk_queue_delay_seconds",
+    "Time a callback waited in the Tk event queue after root.after(0, ...)")
+SAVE_DURATION = REGISTRY.histogram(
+    "study_timer_save_duration_seconds",
+    "Time spent writing one batch of study data to storage")
+SAVE_BYTES = REGISTRY.counter(
+    "study_timer_save_bytes_total",
+    "Bytes of study records written to storage")
+AUDIO_SPAWNS = REGISTRY.counter(
+    "study_timer_audio_process_spawns_total",
+    "Audio helper processes started (players, decoders, output streams)")
+WIDGET_REDRAWS = REGISTRY.counter(
+    "study_timer_widget_redraws_total",
+    "Timer labels reconfigured by update_display")
+TIMER_WAKEUPS = REGISTRY.counter(
+    "study_timer_timer_wakeups_total",
+    "Countdown ticks delivered to the UI; about one per second while visible")
+CHART_RENDER = REGISTRY.histogram(
+    "study_timer_chart_render_seconds",
+    "Time from requesting an uncached history chart until its coordinates were ready")
+
+
+class TraceWriter:
+    """Appends one JSON object per event to a file"""
+
+    def __init__(self, path):
+        self._file = open(path, 'a', buffering=1)  # line buffered
+        self._lock = threading.Lock()
+
+    def write(self, event, fields):
+        fields['event'] = event
+        fields['ts'] = time.time()
+        line = json.dumps(fields) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+_trace = None
+
+
+def enable_trace(path):
+    """Start writing trace events to path"""
+    global _trace
+    _trace = TraceWriter(path)
+
+
+def trace(event, **fields):
+    """Record a trace event; a no-op unless a trace file is enabled"""
+    if _trace is not None:
+        _trace.write(event, fields)
+
+
+def start_metrics_server(port):
+    """Serve /metrics on 127.0.0.1:port from a daemon thread"""
+    # Imported here, so http.server (~40 ms) stays off the startup path unless metrics are served
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # keep scrapes out of the console
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
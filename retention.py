@@ -0,0 +1,263 @@
+"""
+Retention
+Tiered storage that keeps data.json small however long the history gets
+Days older than the hot window (and not updated in the last month) are
+moved, a batch per compaction, into a gzip archive (data.archive.jsonl.gz) that is only read when the full
+history is asked for, and summed into weekly and monthly rollups
+(data.rollups.json) for cheap exact totals. The archive is streamed, so
+reading it takes constant memory however long the history is. An archive
+pass only counts once the snapshot records the archive's new length, so a
+pass cut short by a crash is truncated away by the next one and never
+counted twice
+"""
+
+import gzip
+import json
+import os
+from datetime import date, datetime, timedelta
+
+from journal import SessionJournal, add_record, iter_json_object
+
+# Days kept in data.json in full detail: the 365-day rolling totals and the
+# stats window's year view never need the archive
+HOT_DAYS = 400
+# Days moved per compaction, so a long legacy data.json shrinks over a few passes
+ARCHIVE_BATCH = 1000
+# Days updated this recently stay hot even when older than the hot window, so
+# finding what changed since a recent time (the last sync) never reads the archive
+UPDATE_GRACE_DAYS = 30
+
+
+def week_key(day):
+    """Monday of the ISO week containing day (YYYY-MM-DD)"""
+    d = date.fromisoformat(day)
+    return (d - timedelta(days=d.weekday())).isoformat()
+
+
+def month_key(day):
+    return day[:7]
+
+
+def add_rollups(rollups, records):
+    """Add (day, record) pairs onto {'weekly': {...}, 'monthly': {...}} summaries"""
+    for day, record in records:
+        increment = {'session_count': record.get('session_count', 0),
+                     'total_study_time': record.get('total_study_time', 0)}
+        for tier, key in (('weekly', week_key(day)), ('monthly', month_key(day))):
+            current = rollups[tier].get(key)
+            if current is None:
+                rollups[tier][key] = dict(increment)
+            else:
+                for field, value in increment.items():
+                    current[field] += value
+    return rollups
+
+
+class LimitedReader:
+    """Read-only view of the first `limit` bytes of a binary file"""
+
+    def __init__(self, f, limit):
+        self.f = f
+        self.remaining = limit
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+
+class HistoryArchive:
+    """The cold tiers beside a data file: compressed raw days plus their rollups"""
+
+    def __init__(self, data_file, hot_days=HOT_DAYS, batch=ARCHIVE_BATCH, grace_days=UPDATE_GRACE_DAYS):
+        base, _ = os.path.splitext(data_file)
+        self.path = base + ".archive.jsonl.gz"
+        self.rollups_path = base + ".rollups.json"
+        self.hot_days = hot_days
+        self.batch = batch
+        self.grace_days = grace_days
+
+    def cutoff(self, today=None):
+        """The first day of the hot window; every archived day is before it"""
+        return ((today or date.today()) - timedelta(days=self.hot_days)).isoformat()
+
+    def updated_cutoff(self, today=None):
+        """last_updated stamps from here on keep a day hot; days updated since then are never archived"""
+        start = (today or date.today()) - timedelta(days=self.grace_days)
+        return datetime.combine(start, datetime.min.time()).isoformat()
+
+    def expired(self, all_data, today=None):
+        """The oldest days of a snapshot that have left the hot window, at most one batch"""
+        cutoff = self.cutoff(today)
+        updated_cutoff = self.updated_cutoff(today)
+        days = sorted(day for day, record in all_data.items()
+                      if not day.startswith("_") and day < cutoff
+                      and (record.get('last_updated') or "") < updated_cutoff)
+        return days[:self.batch]
+
+    def append(self, records, committed_size):
+        """Archive (day, record) pairs after the committed part; returns the new committed size
+
+        Anything past committed_size was written by a pass that never
+        committed, and is dropped first
+        """
+        member = gzip.compress("".join(json.dumps(dict(record, date=day), separators=(',', ':')) + "\n"
+                                       for day, record in records).encode())
+        with open(self.path, 'ab'):
+            pass  # create it on the first pass
+        with open(self.path, 'r+b') as f:
+            f.truncate(committed_size)
+            f.seek(committed_size)
+            f.write(member)
+            f.flush()
+            os.fsync(f.fileno())
+        return committed_size + len(member)
+
+    def iter_days(self, committed_size, extra=None):
+        """Every archived (day, record), each day summed, in date order
+
+        extra ({day: record}, e.g. snapshot days that were also archived) is
+        added in. Passes archive days in date order, so the archive is
+        streamed once; only days archived out of order (studied again after
+        they were archived) are summed by an extra pass first
+        """
+        _, out_of_order = self.order(committed_size)
+        pending = {}  # day -> record, yielded at its place in the date order
+        if out_of_order:
+            for day, record in self._read(committed_size):
+                if day in out_of_order:
+                    pending[day] = add_record(pending.get(day), record)
+        for day, record in (extra or {}).items():
+            pending[day] = add_record(pending.get(day), record)
+        queue = sorted(pending, reverse=True)
+        for day, record in self._read(committed_size):
+            if day in out_of_order:
+                continue
+            while queue and queue[-1] < day:
+                earlier = queue.pop()
+                yield earlier, pending.pop(earlier)
+            if queue and queue[-1] == day:
+                queue.pop()
+                record = add_record(record, pending.pop(day))
+            yield day, record
+        while queue:
+            day = queue.pop()
+            yield day, pending.pop(day)
+
+    def order(self, committed_size):
+        """(last archived day in date order, set of days archived out of order)
+
+        Read from the head of the rollups file without loading the rollups,
+        or worked out from the archive if the file is out of date
+        """
+        try:
+            with open(self.rollups_path, 'r') as f:
+                head = {}
+                for key, value in iter_json_object(f):
+                    head[key] = value
+                    if len(head) == 3:
+                        break  # the rollups come after the order fields
+            if head.get('archive_size') == committed_size and 'out_of_order' in head:
+                return head['last_day'], set(head['out_of_order'])
+        except (OSError, ValueError):
+            pass
+        last_day = None
+        out_of_order = set()
+        for day, _ in self._read(committed_size):
+            if last_day is not None and day <= last_day:
+                out_of_order.add(day)
+            else:
+                last_day = day
+        return last_day, out_of_order
+
+    def rollups(self, committed_size):
+        """Weekly and monthly totals of the archived days, plus the archive's day order
+
+        Rebuilt from the archive if the file is missing or was left by a
+        pass that never committed; only the compactor writes it
+        """
+        try:
+            with open(self.rollups_path, 'r') as f:
+                rollups = json.load(f)
+            if rollups.get('archive_size') == committed_size and 'out_of_order' in rollups:
+                return rollups
+        except (OSError, ValueError):
+            pass
+        return self._add({'weekly': {}, 'monthly': {}, 'last_day': None, 'out_of_order': []},
+                         self._read(committed_size))
+
+    def _add(self, rollups, records):
+        """Add archived (day, record) pairs, in archive order, onto rollups"""
+        out_of_order = set(rollups['out_of_order'])
+        last_day = rollups['last_day']
+        for day, record in records:
+            add_rollups(rollups, ((day, record),))
+            if last_day is not None and day <= last_day:
+                out_of_order.add(day)
+            else:
+                last_day = day
+        rollups['last_day'] = last_day
+        rollups['out_of_order'] = sorted(out_of_order)
+        return rollups
+
+    def summarise(self, days, committed_size):
+        """The archive's rollups with more (day, record) pairs added, e.g. the hot days"""
+        rollups = self.rollups(committed_size)
+        return add_rollups({'weekly': rollups['weekly'], 'monthly': rollups['monthly']}, days)
+
+    def save_rollups(self, rollups, committed_size):
+        # The small order fields go first, so order() can stop reading after them
+        rollups = {'archive_size': committed_size, 'last_day': rollups['last_day'],
+                   'out_of_order': rollups['out_of_order'],
+                   'weekly': rollups['weekly'], 'monthly': rollups['monthly']}
+        tmp_path = self.rollups_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(rollups, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.rollups_path)
+
+    def archive(self, all_data, committed_size, today=None):
+        """Move expired days out of all_data into the archive and rollups
+
+        Returns the new committed size, which the caller must store in the
+        snapshot for the pass to count
+        """
+        days = self.expired(all_data, today)
+        if not days:
+            return committed_size
+        records = [(day, all_data[day]) for day in days]
+        rollups = self.rollups(committed_size)
+        size = self.append(records, committed_size)
+        self.save_rollups(self._add(rollups, records), size)
+        for day in days:
+            del all_data[day]
+        return size
+
+    def _read(self, committed_size):
+        """Stream (day, record) for each archived line, in archive order
+
+        Each pass appended one gzip member, and GzipFile reads them back to
+        back; the bytes past committed_size belong to a pass that never
+        committed and are never read
+        """
+        if not committed_size or not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f, gzip.GzipFile(fileobj=LimitedReader(f, committed_size)) as lines:
+            for line in lines:
+                entry = json.loads(line)
+                yield entry.pop('date'), entry
+
+
+def history_rollups(storage):
+    """Weekly and monthly totals over the whole history
+
+    A SessionJournal with an archive answers for the archived days from its
+    rollups, without decompressing the archive; anything else is summed
+    day by day
+    """
+    if isinstance(storage, SessionJournal) and storage.archive is not None:
+        return storage.rollups()
+    return add_rollups({'weekly': {}, 'monthly': {}}, storage.iter_days())
@@ -0,0 +1,154 @@
+"""
+Status File
+Fixed-layout snapshot of the running timer in a memory-mapped file
+The timer writes mode, deadline and today's totals into data/status.bin
+under a sequence lock; status bars and prompts map the file once and then
+read it with plain memory loads, never blocking the writer. Several
+windows and the daemon may be open at once; the one holding the file's
+writer lock publishes and the others skip until it exits
+"""
+
+import math
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MAGIC = b"STST"
+VERSION = 1
+# magic, version, record size, sequence, mode, running, pid, then doubles:
+# deadline (unix time), remaining, session_count, total_study_time,
+# study_duration, break_duration (minutes), updated (unix time)
+RECORD = struct.Struct("<4sHHQBBxxI7d")
+SEQUENCE = struct.Struct("<Q")
+SEQUENCE_OFFSET = 8
+# Seconds between a non-writer's attempts to take over the status file
+OWNER_RETRY = 5.0
+
+STUDY_MODE = 0
+BREAK_MODE = 1
+
+Status = namedtuple("Status", "mode running pid deadline remaining session_count total_study_time "
+                              "study_duration break_duration updated")
+
+
+def status_path(data_file):
+    """data/data.json -> data/status.bin"""
+    return os.path.join(os.path.dirname(data_file), "status.bin")
+
+
+def remaining_seconds(status, now=None):
+    """Seconds left on the countdown described by a Status"""
+    if not status.running:
+        return status.remaining
+    return max(0.0, status.deadline - (time.time() if now is None else now))
+
+
+class StatusPublisher:
+    """Writer of the status file while it holds the writer lock
+
+    The sequence lock only works with one writer, so the lock is held for
+    the publisher's lifetime; other instances publish nothing until they
+    can take it over
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a+b')
+        if os.path.getsize(path) < RECORD.size:
+            self._file.truncate(RECORD.size)
+        self._mm = mmap.mmap(self._file.fileno(), RECORD.size)
+        self._pid = os.getpid()
+        self._sequence = 0
+        self.owner = False
+        self._next_attempt = 0.0
+        self._take_over()
+
+    def _take_over(self):
+        """Take the writer lock unless another instance holds it; True if this one writes"""
+        now = time.monotonic()
+        if now < self._next_attempt:
+            return False
+        self._next_attempt = now + OWNER_RETRY
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                # Lock a byte past the record, so readers can still read it
+                self._file.seek(RECORD.size)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        # Carry on from the previous writer's sequence
+        self._sequence = SEQUENCE.unpack_from(self._mm, SEQUENCE_OFFSET)[0]
+        self._sequence += self._sequence & 1  # a writer killed mid-update left it odd
+        self.owner = True
+        return True
+
+    def publish(self, engine):
+        """Write the engine's current state"""
+        now = engine.clock.time()
+        remaining = engine.countdown.remaining() if engine.is_running else engine.time_remaining
+        self.write(STUDY_MODE if engine.is_study_time else BREAK_MODE, engine.is_running,
+                   now + remaining if engine.is_running else 0.0, remaining,
+                   engine.session_count, engine.total_study_time,
+                   engine.study_duration, engine.break_duration, now)
+
+    def write(self, mode, running, deadline, remaining, session_count, total_study_time,
+              study_duration, break_duration, updated):
+        if not self.owner and not self._take_over():
+            return  # another instance is publishing
+        # Odd sequence while writing; readers retry until they see the same even value twice
+        self._sequence += 1
+        SEQUENCE.pack_into(self._mm, SEQUENCE_OFFSET, self._sequence)
+        RECORD.pack_into(self._mm, 0, MAGIC, VERSION, RECORD.size, self._sequence, mode, running,
+                         self._pid, deadline, remaining, session_count, total_study_time,
+                         study_duration, break_duration, updated)
+        self._sequence += 1
+        SEQUENCE.pack_into(self._mm, SEQUENCE_OFFSET, self._sequence)
+
+    def close(self):
+        self._mm.close()
+        self._file.close()  # releases the writer lock
+
+
+class StatusReader:
+    """Maps the status file once; each read() is a handful of memory loads"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), RECORD.size, access=mmap.ACCESS_READ)
+
+    def read(self, retries=1000):
+        """The latest consistent Status, or None if nothing has been published yet"""
+        for _ in range(retries):
+            before = SEQUENCE.unpack_from(self._mm, SEQUENCE_OFFSET)[0]
+            if before & 1:
+                continue  # a write is in progress
+            fields = RECORD.unpack_from(self._mm, 0)
+            if SEQUENCE.unpack_from(self._mm, SEQUENCE_OFFSET)[0] != before:
+                continue
+            magic, version, size, _, mode, running, pid, *values = fields
+            if magic != MAGIC or version != VERSION or size != RECORD.size:
+                return None
+            return Status(mode, bool(running), pid, *values)
+        raise TimeoutError("status file is being rewritten continuously")
+
+    def close(self):
+        self._mm.close()
+
+
+def format_status(status, now=None):
+    """One-line summary for status bars, e.g. 'Study 24:13 | 3.5 sessions, 87 min'"""
+    seconds = int(math.ceil(remaining_seconds(status, now)))
+    mode = "Study" if status.mode == STUDY_MODE else "Break"
+    state = "" if status.running else " (paused)"
+    return (f"{mode} {seconds // 60:02d}:{seconds % 60:02d}{state} | "
+            f"{status.session_count:.1f} sessions, {status.total_study_time:.0f} min")
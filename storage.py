@@ -0,0 +1,304 @@
+"""
+Storage
+Pluggable persistence for daily study totals
+The JSON backend (data.json plus its append-only journal) stays the
+default; the SQLite backend keeps one row per day in WAL mode, indexed by
+date, and writes batches in a single transaction. Saves are increments
+added onto the stored day, so several processes can write at once without
+losing updates. WriteBehindStorage wraps either one so saves are handed to
+a background writer thread
+"""
+
+import logging
+import os
+import threading
+import time
+
+from journal import SessionJournal, add_record
+from metrics import SAVE_BYTES, SAVE_DURATION, trace
+from retention import HistoryArchive
+
+log = logging.getLogger("study_timer.storage")
+
+BACKENDS = ("json", "sqlite")
+
+# Seconds before retrying a failed background write, doubling up to the maximum
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+
+
+class SqliteStorage:
+    """SQLite backend with one row per day, keyed (and indexed) by date"""
+
+    def __init__(self, db_file):
+        import sqlite3  # only when the SQLite backend is chosen, to keep it off the startup path
+
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        # Shared across the UI and writer threads; access is serialised by _lock
+        # Other processes may hold the write lock; wait for it rather than fail
+        self._conn = sqlite3.connect(db_file, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS days ("
+            " date TEXT PRIMARY KEY,"
+            " session_count REAL NOT NULL,"
+            " total_study_time REAL NOT NULL,"
+            " last_updated TEXT"
+            ") WITHOUT ROWID")
+        # For finding the days changed since the last sync
+        self._conn.execute("CREATE INDEX IF NOT EXISTS days_last_updated ON days (last_updated)")
+        self._conn.commit()
+
+    def load(self):
+        """Every stored day as a {date string: record} dict"""
+        return dict(self.days_between("0000-00-00", "9999-99-99"))
+
+    def days_between(self, start, end):
+        """(day, record) pairs for start <= day <= end, in date order"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT date, session_count, total_study_time, last_updated FROM days"
+                " WHERE date BETWEEN ? AND ? ORDER BY date", (start, end)).fetchall()
+        return [(day, {'session_count': count, 'total_study_time': minutes, 'last_updated': updated})
+                for day, count, minutes, updated in rows]
+
+    def changed_since(self, since):
+        """(day, record) pairs whose last_updated is at or after since (an ISO timestamp)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT date, session_count, total_study_time, last_updated FROM days"
+                " WHERE last_updated >= ? ORDER BY date", (since,)).fetchall()
+        return [(day, {'session_count': count, 'total_study_time': minutes, 'last_updated': updated})
+                for day, count, minutes, updated in rows]
+
+    def has_days(self):
+        """True once any day is stored"""
+        with self._lock:
+            return self._conn.execute("SELECT EXISTS (SELECT 1 FROM days)").fetchone()[0] == 1
+
+    def iter_days(self, batch_size=1000):
+        """Yield every stored (day, record) in date order, one page of rows at a time"""
+        last_day = ""
+        while True:
+            # Keyset paging on the primary key, so no cursor stays open between pages
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT date, session_count, total_study_time, last_updated FROM days"
+                    " WHERE date > ? ORDER BY date LIMIT ?", (last_day, batch_size)).fetchall()
+            if not rows:
+                return
+            for day, count, minutes, updated in rows:
+                yield day, {'session_count': count, 'total_study_time': minutes, 'last_updated': updated}
+            last_day = rows[-1][0]
+
+    def add(self, day, record):
+        """Add one day's increments"""
+        self.add_days([(day, record)])
+
+    def add_days(self, records):
+        """Add a batch of (day, increments) pairs in one transaction; returns the payload size in bytes"""
+        return self._upsert(records, " session_count = session_count + excluded.session_count,"
+                                     " total_study_time = total_study_time + excluded.total_study_time,"
+                                     " last_updated = coalesce(max(last_updated, excluded.last_updated),"
+                                     " excluded.last_updated, last_updated)")
+
+    def save_days(self, records):
+        """Store a batch of (day, record) pairs that replace those days' totals"""
+        return self._upsert(records, " session_count = excluded.session_count,"
+                                     " total_study_time = excluded.total_study_time,"
+                                     " last_updated = excluded.last_updated")
+
+    def _upsert(self, records, update):
+        rows = [(day, record.get('session_count', 0), record.get('total_study_time', 0),
+                 record.get('last_updated')) for day, record in records]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO days (date, session_count, total_study_time, last_updated)"
+                " VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(date) DO UPDATE SET" + update, rows)
+        # date + two REALs + timestamp per row
+        return sum(len(day) + 16 + len(updated or "") for day, _, _, updated in rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class WriteBehindStorage:
+    """Queues saves for a background writer so the caller never waits on disk
+
+    Saves are increments the engine will not send again, so a batch that
+    fails to write stays queued and is retried with a backoff
+    """
+
+    def __init__(self, storage, max_pending_days=1000):
+        self.storage = storage
+        self.max_pending_days = max_pending_days
+        self._cond = threading.Condition()
+        # Pending increments keyed by day; a burst of saves for the same day
+        # is summed into one record, which keeps the queue bounded
+        self._pending = {}
+        self._writing = False
+        self._failed = False  # the last write failed and its batch is waiting to be retried
+        self._callbacks = []  # from when_written(), run once the queue is written out
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def add(self, day, record):
+        """Queue one day's increments"""
+        self.add_days([(day, record)])
+
+    def add_days(self, records):
+        """Queue a batch of (day, increments) pairs, waiting only if the queue is full"""
+        with self._cond:
+            for day, record in records:
+                self._cond.wait_for(lambda: len(self._pending) < self.max_pending_days
+                                    or day in self._pending)
+                self._pending[day] = add_record(self._pending.get(day), record)
+            self._cond.notify_all()
+
+    def when_written(self, callback):
+        """Call callback once everything queued so far is on disk
+
+        It runs on the writer thread when the queue next empties after a
+        successful write, or straight away if nothing is queued; never if
+        the writes keep failing
+        """
+        with self._cond:
+            if self._pending or self._writing:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def load(self):
+        self.flush()
+        return self.storage.load()
+
+    def days_between(self, start, end):
+        self.flush()
+        return self.storage.days_between(start, end)
+
+    def iter_days(self):
+        self.flush()
+        return self.storage.iter_days()
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is written
+
+        False if the deadline passed or a failed write is waiting to be retried
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: (not self._pending or self._failed) and not self._writing, timeout)
+            return not self._pending and not self._writing
+
+    def close(self, timeout=None):
+        """Write what is queued within the deadline and stop the writer thread
+
+        A failed batch is retried once straight away; False if anything is
+        still unwritten
+        """
+        with self._cond:
+            self._closed = True  # also cuts a retry backoff short
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        with self._cond:
+            return not self._pending and not self._writing
+
+    def _run(self):
+        delay = 0
+        while True:
+            with self._cond:
+                if delay:
+                    self._cond.wait_for(lambda: self._closed, delay)
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending or (self._closed and self._failed and delay == 0):
+                    return  # done, or the retry on close failed too
+                batch, self._pending = self._pending, {}
+                self._writing = True
+                self._cond.notify_all()  # wake producers waiting for room
+
+            try:
+                started = time.perf_counter()
+                written = self.storage.add_days(sorted(batch.items())) or 0
+                duration = time.perf_counter() - started
+                SAVE_DURATION.observe(duration)
+                SAVE_BYTES.inc(written)
+                trace("save", days=len(batch), bytes=written, duration=duration)
+                failed = False
+            except Exception as e:
+                log.error("Error saving data, will retry: %s", e)
+                failed = True
+
+            callbacks = []
+            with self._cond:
+                if failed:
+                    # Put the batch back in front of anything queued meanwhile
+                    for day, record in self._pending.items():
+                        batch[day] = add_record(batch.get(day), record)
+                    self._pending = batch
+                    delay = 0 if self._closed else min(max(delay * 2, RETRY_DELAY), MAX_RETRY_DELAY)
+                else:
+                    delay = 0
+                    if not self._pending:
+                        callbacks, self._callbacks = self._callbacks, []
+                self._failed = failed
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    log.error("Error after saving data: %s", e)
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+def sqlite_path(data_file):
+    """data/data.json -> data/data.db"""
+    return os.path.splitext(data_file)[0] + ".db"
+
+
+def sync_state_path(data_file):
+    """data/data.json -> data/sync.json"""
+    return os.path.join(os.path.dirname(data_file), "sync.json")
+
+
+def open_storage(data_file, backend=None, synced=True):
+    """Open the configured backend (STUDY_TIMER_STORAGE=json|sqlite)
+
+    Once this device has synced, reads also include the other devices'
+    study unless synced is False
+    """
+    backend = (backend or os.environ.get("STUDY_TIMER_STORAGE") or "json").lower()
+    if backend == "json":
+        storage = SessionJournal(data_file, archive=HistoryArchive(data_file))
+    elif backend == "sqlite":
+        storage = SqliteStorage(sqlite_path(data_file))
+    else:
+        raise ValueError(f"Unknown storage backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    if synced and os.path.exists(sync_state_path(data_file)):
+        # Imported only once this device has synced; http.client is slow to import
+        from sync import SyncedStorage
+        return SyncedStorage(storage, sync_state_path(data_file))
+    return storage
+
+
+def migrate_json_to_sqlite(data_file, db_file=None, force=False):
+    """Copy every day from data.json (its journal and archive too) into SQLite; returns the day count
+
+    Days are copied as absolute totals, so a database that already has
+    days (e.g. from using the SQLite backend since an earlier migration)
+    is refused unless force is set, which replaces those days
+    """
+    history = SessionJournal(data_file, archive=HistoryArchive(data_file)).load_all()
+    storage = SqliteStorage(db_file or sqlite_path(data_file))
+    try:
+        if not force and storage.has_days():
+            raise ValueError(f"{storage.db_file} already has study data; migrating again would "
+                             "overwrite it with the JSON totals")
+        storage.save_days(sorted(history.items()))
+    finally:
+        storage.close()
+    return len(history)
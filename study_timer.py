@@ -6,27 +6,120 @@ Tracks study sessions and total study time per day
 """
 
 import time
-import threading
-import tkinter as tk
-from tkinter import ttk
+_MODULE_STARTED = time.perf_counter()  # start of the "imports" startup phase
+
+import argparse
+import functools
+import json
+import logging
 import platform
-import subprocess
 import os
-import json
-from datetime import datetime
-from dotenv import load_dotenv
+import sys
+import threading
+import metrics
+import transfer
+from analytics import StudyAnalytics
+from charts import ChartRenderer, StatsWindow
+from checkpoint import SessionCheckpoint
+from events import EventStore, events_path
+from retention import history_rollups
+from status import StatusPublisher, StatusReader, format_status, status_path
+from storage import WriteBehindStorage, migrate_json_to_sqlite, open_storage, sqlite_path, sync_state_path
+from timer_engine import STUDY, StudyEngine, TimerWorker, display_seconds
 
-# Load environment variables
-load_dotenv()
+# tkinter, subprocess, dotenv and winsound are imported where they are first
+# needed so they stay off the path to the first visible frame
 
-# Import winsound only on Windows
-if platform.system() == "Windows":
-    import winsound
+log = logging.getLogger("study_timer")
 
 
+@functools.lru_cache(maxsize=None)
+def sound_for_duration(system, study_duration):
+    """Resolve the notification sound for a platform and study duration"""
+    if system == "Windows":
+        return None  # system beep
+    if system != "Darwin":  # Linux
+        return "/usr/share/sounds/alsa/Front_Left.wav"
+    # For test mode (5 seconds), use Glass sound
+    if study_duration <= 0.1:
+        return "/System/Library/Sounds/Glass.aiff"
+    elif study_duration == 25:
+        return "/System/Library/Sounds/Glass.aiff"  # Glass sound for 25 min
+    else:
+        return "/System/Library/Sounds/Ping.aiff"   # Ping sound for 50 min
 
-class StudyTimer:
+
+class StartupProfiler:
+    """Times each startup phase for --profile-startup"""
+    
+    def __init__(self, output_file=None, quit_after_startup=False):
+        self.output_file = output_file  # optional JSON report path
+        self.quit_after_startup = quit_after_startup
+        self.phases = []
+        self._last = _MODULE_STARTED
+    
+    def mark(self, phase):
+        """Record the time since the previous mark as phase"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+    
+    def report(self):
+        """Print the per-phase timings and optionally write them as JSON"""
+        print("Startup profile:")
+        elapsed = 0.0
+        first_frame = None
+        for phase, seconds in self.phases:
+            elapsed += seconds
+            print(f"  {phase:<14}{seconds * 1000:8.1f} ms")
+            if phase == "first_frame":
+                first_frame = elapsed
+        print(f"  {'total':<14}{elapsed * 1000:8.1f} ms")
+        
+        if self.output_file:
+            with open(self.output_file, 'w') as f:
+                json.dump({
+                    'phases_ms': {phase: seconds * 1000 for phase, seconds in self.phases},
+                    'first_frame_ms': None if first_frame is None else first_frame * 1000,
+                    'total_ms': elapsed * 1000,
+                }, f, indent=2)
+
+
+def format_clock(seconds):
+    """Format seconds as MM:SS"""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+class RenderCache:
+    """Reconfigures a widget only when its text differs from the last render"""
+    
     def __init__(self):
+        self._last_text = {}  # widget path -> text currently shown
+        self.redraws = 0  # widgets reconfigured by the latest render
+    
+    def begin(self):
+        """Start a new render pass"""
+        self.redraws = 0
+    
+    def set_text(self, widget, text):
+        key = str(widget)
+        if self._last_text.get(key) != text:
+            widget.config(text=text)
+            self._last_text[key] = text
+            self.redraws += 1
+
+
+class StudyTimer:
+    SAVE_FLUSH_TIMEOUT = 3.0  # seconds on_closing waits for pending saves
+    
+    def __init__(self, profiler=None):
+        import tkinter as tk
+        
+        self.profiler = profiler
+        if profiler:
+            profiler.mark("imports")
+        
         self.root = tk.Tk()
         self.root.title("")  # Remove duplicate title
         self.root.geometry("440x320")
@@ -35,44 +128,98 @@ class StudyTimer:
         # Set dark theme colors
         self.root.configure(bg='black')
         
-        # Timer settings
-        self.study_duration = 25  # minutes
-        self.break_duration = 5   # minutes
-        self.is_running = False # indicates whether the timer is running
-        
-        # indicates whether the timer is in study time
-        # true: study time, false: break time
-        self.is_study_time = True 
+        # Data collection
+        self.data_dir = "data"
+        self.data_file = os.path.join(self.data_dir, "data.json")
         
-        self.time_remaining = self.study_duration * 60  # seconds
-        self.timer_thread = None
-        self.sound_thread = None 
+        # Create data directory if it doesn't exist
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+            log.info("Created data directory: %s", self.data_dir)
+        
+        # Timer state and session tracking live in the headless engine;
+        # this class only maps it onto widgets, sounds and threads
+        # Saves go to a background writer so disk latency never blocks the UI
+        self.storage = WriteBehindStorage(open_storage(self.data_file))
+        self.engine = StudyEngine(storage=self.storage,
+                                  analytics=StudyAnalytics(),
+                                  events=open_events(self.data_file),
+                                  checkpoint=open_checkpoint(self.data_dir))
+        # Status bars and scripts read the timer state from this mapped file
+        self.status = open_status(self.data_file)
+        
+        # One long-lived thread posts ticks; start/pause/switch only bump its generation
+        self.timer_worker = TimerWorker(self.engine.countdown, self.post_tick, heartbeat=self.engine.heartbeat)
+        self.alarm = None  # AlarmWorker, created on the first ring
+        self.charts = None  # ChartRenderer, created when the stats window first opens
+        self.stats_window = None
         self.playing_sound = False # indicates whether the sound is playing
         
+        # Only changed label text is pushed to Tk on each tick
+        self.render = RenderCache()
+        
         # Audio playback
         self.audio_file = "binaural_beat.mp3"
-        self.audio_process = None
+        self.audio_track = None  # BackgroundTrack, created on first play
         
-        # Session tracking
-        self.session_count = 0
-        self.total_study_time = 0
-        self.session_start_time = None  # Track when current session started
-        
-        # Data collection
-        self.data_dir = "data"
-        self.today = datetime.now().strftime("%Y-%m-%d")
-        self.data_file = os.path.join(self.data_dir, "data.json")
-        self.load_data()
+        if profiler:
+            profiler.mark("tk_init")
         
         # Setup UI
         self.setup_ui()
         self.update_display()
+        if profiler:
+            profiler.mark("build_ui")
+        
+        # History is loaded once the window has been drawn; while the window is
+        # minimized or covered the countdown only wakes for its deadline
+        self.started = False
+        self.root.bind("<Map>", self.on_map)
+        self.root.bind("<Unmap>", self.on_unmap)
+        self.root.bind("<Visibility>", self.on_visibility)
         
         # Handle window closing
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
     
+    def on_map(self, event):
+        """Resume per-second ticks when the window is shown; the first time, load history"""
+        if event.widget is not self.root:
+            return
+        self.set_visible(True)
+        if not self.started:
+            self.started = True
+            # Tk redraws in idle callbacks queued by the map, so this runs after them
+            self.root.after_idle(self.finish_startup)
+    
+    def on_unmap(self, event):
+        """The window was minimized or withdrawn"""
+        if event.widget is self.root:
+            self.set_visible(False)
+    
+    def on_visibility(self, event):
+        """The window was covered by other windows or uncovered"""
+        if event.widget is self.root:
+            self.set_visible(event.state != "VisibilityFullyObscured")
+    
+    def set_visible(self, visible):
+        self.timer_worker.set_visible(visible)
+    
+    def finish_startup(self):
+        """Load history after the first visible frame"""
+        if self.profiler:
+            self.profiler.mark("first_frame")
+        self.load_data()
+        if self.profiler:
+            self.profiler.mark("load_history")
+            self.profiler.report()
+            if self.profiler.quit_after_startup:
+                self.root.destroy()
+    
     def setup_ui(self):
         """Create the user interface"""
+        import tkinter as tk
+        from tkinter import ttk
+        
         # Main frame
         main_frame = ttk.Frame(self.root, padding="20")
         main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -104,6 +251,8 @@ class StudyTimer:
         title_label.bind("<Leave>", lambda e: title_label.config(bg='black'))
         title_frame.bind("<Enter>", lambda e: title_label.config(bg='gray30'))
         title_frame.bind("<Leave>", lambda e: title_label.config(bg='black'))
+        # Clicking the title opens the history charts
+        title_label.bind("<Button-1>", lambda e: self.open_stats())
         
         # Timer display - dual clocks
         timer_frame = ttk.Frame(main_frame)
@@ -176,23 +325,17 @@ class StudyTimer:
     
     def set_25_5(self):
         """Set timer to 25 minute study, 5 minute break"""
-        if not self.is_running:
-            self.study_duration = 25
-            self.break_duration = 5
+        if self.engine.set_durations(25, 5):
             self.reset_timer()
     
     def set_50_10(self):
         """Set timer to 50 minute study, 10 minute break"""
-        if not self.is_running:
-            self.study_duration = 50
-            self.break_duration = 10
+        if self.engine.set_durations(50, 10):
             self.reset_timer()
     
     def set_test(self):
         """Set timer to 5 second study, 5 second break (TEST MODE)"""
-        if not self.is_running:
-            self.study_duration = 5/60  # 5 seconds (5/60 minutes)
-            self.break_duration = 5/60  # 5 seconds (5/60 minutes)
+        if self.engine.set_durations(5/60, 5/60):  # 5 seconds (5/60 minutes)
             self.reset_timer()
     
     def toggle_timer(self):
@@ -207,52 +350,43 @@ class StudyTimer:
     def start_timer(self):
         """Start the timer"""
         # Don't start a new timer if one is already running
-        if self.is_running:
+        if self.engine.is_running:
             return
         
-        # Wait for any existing timer thread to finish before starting a new one
-        if self.timer_thread is not None and self.timer_thread.is_alive():
-            # Wait up to 2 seconds for the thread to exit (enough time to finish current sleep)
-            self.timer_thread.join(timeout=2.0)
-            # Double-check the thread is actually dead before proceeding
-            if self.timer_thread.is_alive():
-                # Thread is still alive, wait a bit more and check is_running flag
-                time.sleep(0.2)
-                # If is_running was set to False, the thread should exit on next loop check
-                # We'll proceed but the old thread should stop when it sees is_running is False
-        
-        self.is_running = True
+        self.engine.start()
         self.start_button.config(text="Pause")
         
-        # Set session start time if starting a study session
-        if self.is_study_time and self.session_start_time is None:
-            self.session_start_time = time.time()
-            self.play_audio()  # Start audio for study session
+        # Start or resume audio whenever a study countdown runs
+        if self.engine.is_study_time:
+            self.play_audio()
         
         # Show break button during study sessions
-        if self.is_study_time:
+        if self.engine.is_study_time:
             self.break_button.grid()
         
-        self.timer_thread = threading.Thread(target=self.timer_loop, daemon=True)
-        self.timer_thread.start()
+        # Ticks still queued from the previous countdown are dropped by generation
+        self.timer_worker.start()
+        self.publish_status()
     
     def pause_timer(self):
         """Pause the timer"""
-        self.is_running = False
+        self.engine.pause()
+        self.timer_worker.cancel()
         self.start_button.config(text="Start")
         self.break_button.grid_remove()  # Hide break button when paused
         self.stop_sound()
         self.stop_audio()
+        self.publish_status()
     
     def stop_timer(self):
         """Stop the timer and sound only"""
-        self.is_running = False
         self.playing_sound = False
         self.stop_sound()
         self.stop_audio()
         
         # Add partial session time to total study time
-        self.add_partial_session_time()
+        self.engine.stop()
+        self.timer_worker.cancel()
         
         # Just stop the sound, don't auto-start anything
         self.start_button.config(text="Start")
@@ -265,16 +399,10 @@ class StudyTimer:
         self.stop_sound()
         self.stop_audio()  # Stop audio during break
         
-        # Add partial session time to total study time before switching to break
+        # Add partial session time to total study time and switch to break mode
         # Note: This does NOT count as a full session - only tracks actual study time
-        self.add_partial_session_time()
-        
-        # Ensure any existing timer thread is stopped before starting a new one
-        self.is_running = False
-        
-        # Switch to break mode
-        self.is_study_time = False
-        self.time_remaining = self.break_duration * 60
+        self.engine.switch_to_break()
+        self.timer_worker.cancel()
         
         self.start_button.config(text="Pause")
         self.start_timer()
@@ -286,15 +414,9 @@ class StudyTimer:
         self.playing_sound = False  # Stop the notification sound
         self.stop_sound()
         
-        # Add partial session time to total study time before starting new study session
-        self.add_partial_session_time()
-        
-        # Ensure any existing timer thread is stopped before starting a new one
-        self.is_running = False
-        
-        # Switch to study mode
-        self.is_study_time = True
-        self.time_remaining = self.study_duration * 60
+        # Add partial session time to total study time and switch to study mode
+        self.engine.switch_to_study()
+        self.timer_worker.cancel()
         
         self.start_button.config(text="Pause")
         self.start_timer()  # This will call play_spotify() internally
@@ -302,13 +424,9 @@ class StudyTimer:
     
     def reset_timer(self):
         """Reset the timer to initial state"""
-        self.is_running = False
-        
         # Add partial session time to total study time before resetting
-        self.add_partial_session_time()
-        
-        self.is_study_time = True
-        self.time_remaining = self.study_duration * 60
+        self.engine.reset()
+        self.timer_worker.cancel()
         self.start_button.config(text="Start")
         self.break_button.grid_remove()  # Hide break button
         self.study_button.grid_remove()  # Hide study button
@@ -316,37 +434,42 @@ class StudyTimer:
         self.stop_audio()  # Stop audio when resetting
         self.update_display()
     
-    def timer_loop(self):
-        """Main timer loop running in separate thread"""
-        while self.is_running and self.time_remaining > 0:
-            time.sleep(1)
-            if self.is_running:
-                self.time_remaining -= 1
-                self.root.after(0, self.update_display)
-        
-        # Timer completed - call completion handler
-        if self.time_remaining == 0:
-            self.root.after(0, self.timer_complete)
+    def post_tick(self, generation, scheduled, queued):
+        """Called on the worker thread; hands the tick to the Tk main loop"""
+        self.root.after(0, self.on_tick, generation, scheduled, queued)
+    
+    def on_tick(self, generation, scheduled, queued):
+        """Redraw for a timer tick, record how late it ran and complete an expired timer"""
+        if generation != self.timer_worker.generation:
+            return  # queued before a start, pause or switch
+        # Remaining time is recomputed from the deadline on every tick, so
+        # late wakeups and suspends never accumulate into drift
+        now = self.engine.countdown.clock()
+        metrics.TK_QUEUE_DELAY.observe(now - queued)
+        if scheduled is not None:
+            metrics.TICK_LAG.observe(now - scheduled)
+            metrics.trace("tick", lag=now - scheduled, queue_delay=now - queued)
+        metrics.TIMER_WAKEUPS.inc()
+        self.engine.heartbeat()
+        if self.engine.tick(scheduled):
+            self.timer_complete()
+        else:
+            self.update_display()
     
     def timer_complete(self):
         """Handle timer completion"""
-        self.is_running = False
+        # The engine credits the session and switches modes
+        completed = self.engine.complete()
+        self.timer_worker.cancel()
+        if completed is None:
+            return
+        log.info("Timer drift: %s", self.engine.countdown.drift)
         self.start_button.config(text="Stop")
         
-        if self.is_study_time:
+        if completed == STUDY:
             # Study session completed
-            self.session_count += 1
-            self.total_study_time += self.study_duration
-            self.save_data()  # Save data after each study session
             self.stop_audio()  # Stop the binaural beat when study session ends
             
-            # Reset session start time since session completed naturally
-            self.session_start_time = None
-            
-            # Switch to break mode and prepare break timer
-            self.is_study_time = False
-            self.time_remaining = self.break_duration * 60
-            
             # Break button should already be visible, just ensure it's shown
             self.break_button.grid()
             
@@ -354,10 +477,6 @@ class StudyTimer:
             # Break completed
             self.play_notification_sound()
             
-            # Switch to study mode and prepare study timer
-            self.is_study_time = True
-            self.time_remaining = self.study_duration * 60
-            
             # Hide break button and show Start Study button (don't auto-start)
             self.break_button.grid_remove()
             self.study_button.grid()
@@ -369,199 +488,134 @@ class StudyTimer:
         """Start playing notification sound continuously"""
         if not self.playing_sound:
             self.playing_sound = True
-            self.sound_thread = threading.Thread(target=self.sound_loop, daemon=True)
-            self.sound_thread.start()
+            if self.alarm is None:
+                from audio import AlarmWorker
+                self.alarm = AlarmWorker()
+            self.alarm.ring(self.get_sound_for_duration())
     
     def get_sound_for_duration(self):
         """Get the appropriate sound based on study duration"""
-        # For test mode (5 seconds), use Glass sound
-        if self.study_duration <= 0.1:  
-            return "/System/Library/Sounds/Glass.aiff"
-        elif self.study_duration == 25:
-            return "/System/Library/Sounds/Glass.aiff"  # Glass sound for 25 min
-        else:
-            return "/System/Library/Sounds/Ping.aiff"   # Ping sound for 50 min
-    
-    def sound_loop(self):
-        """Play sound continuously until stopped"""
-        try:
-            if platform.system() == "Windows":
-                while self.playing_sound:
-                    winsound.Beep(1000, 200)  # 1000 Hz for 200ms (shorter beep)
-                    time.sleep(2.5)  # Wait 2.5 seconds between beeps
-            elif platform.system() == "Darwin":  # macOS
-                # Get the appropriate sound based on study duration
-                working_sound = self.get_sound_for_duration()
-                
-                while self.playing_sound:
-                    result = subprocess.run(["afplay", working_sound], capture_output=True, text=True)
-                    if result.returncode != 0:
-                        print(f"Sound failed: {result.stderr}")
-                        # Fallback to system beep
-                        subprocess.run(["osascript", "-e", "beep"], capture_output=True)
-                    time.sleep(2.5)  # Wait 2.5 seconds between sounds
-            else:  # Linux
-                while self.playing_sound:
-                    subprocess.run(["paplay", "/usr/share/sounds/alsa/Front_Left.wav"], capture_output=True)
-                    time.sleep(2.5)  # Wait 2.5 seconds between sounds
-        except Exception as e:
-            print(f"Sound error: {e}")
+        return sound_for_duration(platform.system(), self.engine.study_duration)
     
     def stop_sound(self):
         """Stop playing notification sound"""
         self.playing_sound = False
+        if self.alarm is not None:
+            self.alarm.stop()
     
     def play_audio(self):
-        """Start playing the binaural beat audio file"""
-        if self.audio_process is None and os.path.exists(self.audio_file):
-            try:
-                if platform.system() == "Darwin":  # macOS
-                    self.audio_process = subprocess.Popen(
-                        ["afplay", self.audio_file],
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL
-                    )
-                elif platform.system() == "Windows":
-                    # On Windows, use winsound or another player
-                    print("Audio playback not yet supported on Windows")
-                else:  # Linux
-                    self.audio_process = subprocess.Popen(
-                        ["paplay", self.audio_file],
-                        stdout=subprocess.DEVNULL,
-                        stderr=subprocess.DEVNULL
-                    )
-            except Exception as e:
-                print(f"Failed to play audio: {e}")
+        """Start or resume the binaural beat audio file"""
+        if self.audio_track is None and os.path.exists(self.audio_file):
+            from audio import BackgroundTrack
+            self.audio_track = BackgroundTrack(self.audio_file)
+        if self.audio_track is not None:
+            self.audio_track.play()
     
     def stop_audio(self):
-        """Stop playing the binaural beat audio file"""
-        if self.audio_process is not None:
-            try:
-                self.audio_process.terminate()
-                self.audio_process.wait(timeout=1)
-                self.audio_process = None
-            except Exception as e:
-                print(f"Failed to stop audio: {e}")
-                # Force kill if terminate didn't work
-                try:
-                    self.audio_process.kill()
-                    self.audio_process = None
-                except:
-                    pass
+        """Pause the binaural beat audio file, keeping its position"""
+        if self.audio_track is not None:
+            self.audio_track.pause()
     
     def add_partial_session_time(self):
         """Add partial session time to total study time if in study mode"""
-        if self.is_study_time and self.session_start_time is not None:
-            # Calculate how much study time was completed
-            elapsed_time = time.time() - self.session_start_time
-            elapsed_minutes = elapsed_time / 60
-            
-            # Add to total study time
-            self.total_study_time += elapsed_minutes
-            
-            # Add partial session credit (decimal based on completion percentage)
-            partial_session_credit = elapsed_minutes / self.study_duration
-            self.session_count += partial_session_credit
-            
-            print(f"Added {elapsed_minutes:.2f} minutes and {partial_session_credit:.2f} session credit")
-            
-            # Save the updated data
-            self.save_data()
-            
-            # Reset session start time
-            self.session_start_time = None
+        self.engine.add_partial_session_time()
     
     def load_data(self):
         """Load today's study data from file"""
-        try:
-            # Create data directory if it doesn't exist
-            if not os.path.exists(self.data_dir):
-                os.makedirs(self.data_dir)
-                print(f"Created data directory: {self.data_dir}")
-            
-            # Load data
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r') as f:
-                    all_data = json.load(f)
-                    
-                # Check if we have data for today
-                if self.today in all_data:
-                    today_data = all_data[self.today]
-                    self.session_count = today_data.get('session_count', 0)
-                    self.total_study_time = today_data.get('total_study_time', 0)
-                    print(f"Loaded today's data: {self.session_count} sessions, {self.total_study_time} minutes")
-                else:
-                    print(f"No data found for today ({self.today}), starting fresh")
-                    self.session_count = 0
-                    self.total_study_time = 0
-            else:
-                print(f"No data file found, starting fresh")
-                self.session_count = 0
-                self.total_study_time = 0
-        except Exception as e:
-            print(f"Error loading data: {e}")
-            # Start fresh if there's an error
-            self.session_count = 0
-            self.total_study_time = 0
+        self.engine.load_data()
     
     def save_data(self):
         """Save today's study data to file"""
+        self.engine.save_data()
+    
+    
+    
+    def open_stats(self):
+        """Show the history charts window"""
+        if self.stats_window is not None:
+            self.stats_window.lift()
+            return
+        if self.charts is None:
+            self.charts = ChartRenderer(self.engine.analytics,
+                                        lambda rendered: self.root.after(0, self.on_chart_rendered, rendered))
+            # Startup only loaded the recent days; the long ranges need the archived ones
+            threading.Thread(target=self.load_full_history, daemon=True).start()
+        self.stats_window = StatsWindow(self.root, self.charts, on_close=self.on_stats_closed)
+    
+    def load_full_history(self):
+        """Read every day, archived ones included, off the Tk thread"""
         try:
-            # Load existing data
-            all_data = {}
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r') as f:
-                    all_data = json.load(f)
-            
-            # Update today's data
-            all_data[self.today] = {
-                'session_count': self.session_count,
-                'total_study_time': self.total_study_time,
-                'last_updated': datetime.now().isoformat()
-            }
-            
-            # Save all data back to file
-            with open(self.data_file, 'w') as f:
-                json.dump(all_data, f, indent=2)
-            print(f"Saved today's data: {self.session_count} sessions, {self.total_study_time} minutes")
+            history = dict(self.storage.iter_days())
         except Exception as e:
-            print(f"Error saving data: {e}")
+            log.error("Error loading the full history: %s", e)
+            return
+        self.root.after(0, self.on_full_history, history)
+    
+    def on_full_history(self, history):
+        """Rebuild the analytics over the full history; the stats window redraws on its next refresh"""
+        engine = self.engine
+        if not engine.history_loaded:
+            return  # load_data rebuilds them anyway
+        engine.analytics.rebuild(history)
+        # Today's totals in the engine include saves still queued when the history was read
+        engine.analytics.record(engine.today, engine.session_count, engine.total_study_time)
+        if self.stats_window is not None:
+            self.stats_window.refresh()
     
+    def on_chart_rendered(self, rendered):
+        """A chart finished rendering on the worker thread"""
+        if self.stats_window is not None:
+            self.stats_window.on_rendered(rendered)
+        else:
+            self.charts.store(rendered)
     
+    def on_stats_closed(self):
+        self.stats_window = None
     
     def on_closing(self):
         """Handle window closing - stop all sounds and threads"""
-        self.is_running = False
-        self.playing_sound = False
+        self.engine.pause()
+        self.timer_worker.close()
+        if self.charts is not None:
+            self.charts.close()
+        self.stop_sound()
         self.stop_audio()
+        self.engine.add_partial_session_time()  # credit a session cut short by closing
         self.save_data()  # Save data before closing
+        if not self.storage.close(timeout=self.SAVE_FLUSH_TIMEOUT):
+            log.warning("Some study data could not be written before closing")
+        # Only now, so a session whose credit was not written is kept for recovery
+        if self.engine.checkpoint is not None:
+            self.engine.checkpoint.close()
+        self.publish_status()
         self.root.destroy()
     
     
+    def publish_status(self):
+        """Write the current state to the status file; a few memory stores, no syscalls"""
+        if self.status is not None:
+            self.status.publish(self.engine)
+    
     def update_display(self):
         """Update the timer display"""
-        # Always keep Study on left, Break on right
-        self.active_label.config(text="Study")
-        self.reference_label.config(text="Break")
-        
-        if self.is_study_time:
+        # The "Study"/"Break" headers are static, and the idle clock only
+        # changes with the preset, so usually just one label is redrawn
+        self.render.begin()
+        engine = self.engine
+        if engine.is_study_time:
             # Study mode - show study countdown on left, break duration on right
-            minutes = int(self.time_remaining // 60)
-            seconds = int(self.time_remaining % 60)
-            self.timer_label.config(text=f"{minutes:02d}:{seconds:02d}")
-            
-            break_minutes = int(self.break_duration)
-            break_seconds = int((self.break_duration % 1) * 60)
-            self.break_timer_label.config(text=f"{break_minutes:02d}:{break_seconds:02d}")
+            study_text = format_clock(display_seconds(engine.time_remaining))
+            break_text = format_clock(engine.break_duration * 60)
         else:
             # Break mode - show study duration on left, break countdown on right
-            study_minutes = int(self.study_duration)
-            study_seconds = int((self.study_duration % 1) * 60)
-            self.timer_label.config(text=f"{study_minutes:02d}:{study_seconds:02d}")
-            
-            minutes = int(self.time_remaining // 60)
-            seconds = int(self.time_remaining % 60)
-            self.break_timer_label.config(text=f"{minutes:02d}:{seconds:02d}")
+            study_text = format_clock(engine.study_duration * 60)
+            break_text = format_clock(display_seconds(engine.time_remaining))
+        self.render.set_text(self.timer_label, study_text)
+        self.render.set_text(self.break_timer_label, break_text)
+        metrics.WIDGET_REDRAWS.inc(self.render.redraws)
+        self.publish_status()
+        if self.stats_window is not None:
+            self.stats_window.refresh()  # after a save changed the history
     
     
     
@@ -570,15 +624,255 @@ class StudyTimer:
         self.root.mainloop()
 
 
+def configure_instrumentation(args):
+    """Set up logging, the metrics endpoint and the trace file from flags or the environment"""
+    level = args.log_level or os.environ.get("STUDY_TIMER_LOG_LEVEL") or "WARNING"
+    logging.basicConfig(format="%(levelname)s %(name)s: %(message)s")
+    log.setLevel(level.upper())
+    
+    port = args.metrics_port or os.environ.get("STUDY_TIMER_METRICS_PORT")
+    if port:
+        metrics.start_metrics_server(int(port))
+        log.info("Serving metrics on http://127.0.0.1:%s/metrics", port)
+    
+    trace_file = args.trace_file or os.environ.get("STUDY_TIMER_TRACE_FILE")
+    if trace_file:
+        metrics.enable_trace(trace_file)
+
+
+def open_status(data_file):
+    """Open the shared status file for writing, or None if it cannot be used"""
+    try:
+        return StatusPublisher(status_path(data_file))
+    except (OSError, ValueError) as e:
+        log.error("Timer status will not be published: %s", e)
+        return None
+
+
+def open_events(data_file):
+    """Open the per-session event log, or None if it cannot be used"""
+    try:
+        return EventStore(events_path(data_file))
+    except (OSError, ValueError) as e:
+        log.error("Session events will not be recorded: %s", e)
+        return None
+
+
+def open_checkpoint(data_dir):
+    """Open this instance's session checkpoint, or None if it cannot be used"""
+    try:
+        return SessionCheckpoint(data_dir)
+    except OSError as e:
+        log.error("Interrupted sessions will not be recoverable: %s", e)
+        return None
+
+
+def print_stats(data_file, by_month=False):
+    """Print a summary of the study history"""
+    storage = open_storage(data_file)
+    if by_month:
+        # Archived months come from the rollups, so the archive is not read
+        for month, totals in sorted(history_rollups(storage)['monthly'].items()):
+            print(f"{month:<15}{totals['session_count']:8.1f} sessions {totals['total_study_time']:10.1f} minutes")
+        return
+    # Streaks and all-time totals need every day, archived ones included
+    analytics = StudyAnalytics(dict(storage.iter_days()))
+    summary = analytics.summary()
+    for label, key in (("Last 7 days", 'last_7_days'), ("Last 30 days", 'last_30_days'),
+                       ("Last 365 days", 'last_365_days')):
+        totals = summary[key]
+        print(f"{label:<15}{totals['sessions']:8.1f} sessions {totals['minutes']:10.1f} minutes")
+    print(f"{'All time':<15}{analytics.prefix_sessions[-1]:8.1f} sessions "
+          f"{analytics.prefix_minutes[-1]:10.1f} minutes")
+    print(f"Current streak: {summary['current_streak']} days")
+    print(f"Longest streak: {summary['longest_streak']} days")
+    print("Average minutes by weekday:")
+    for name, minutes in zip(("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"),
+                             summary['weekday_average_minutes']):
+        print(f"  {name} {minutes:6.1f}")
+    
+    if os.path.exists(events_path(data_file)):
+        events = EventStore(events_path(data_file)).summary()
+        print(f"Study intervals: {events['study_intervals']} "
+              f"({events['completion_rate']:.0%} run to completion), "
+              f"mean {events['mean_study_minutes']:.1f} minutes; {events['breaks']} breaks")
+
+
+def ctl_command(data_file, args):
+    """Send one action to the daemon and print its reply"""
+    import daemon
+    request = {'cmd': args.action}
+    if args.action == "preset":
+        if args.preset is None:
+            sys.exit("preset needs 25_5 or 50_10")
+        request['name'] = args.preset
+    try:
+        response = daemon.send_command(data_file, request)
+    except OSError as e:
+        sys.exit(f"Daemon not reachable: {e}")
+    if not response.get('ok'):
+        sys.exit(response.get('error'))
+    if 'result' in response:
+        print(json.dumps(response['result'], indent=2))
+
+
+def status_command(data_file):
+    """Print one line describing the published timer state"""
+    path = status_path(data_file)
+    if not os.path.exists(path):
+        sys.exit("No timer has published its status yet")
+    current = StatusReader(path).read()
+    if current is None:
+        sys.exit("No timer has published its status yet")
+    print(format_status(current))
+
+
+def export_command(data_file, args):
+    """Write the history to --output (or stdout) in CSV or JSONL"""
+    fmt = args.format or (transfer.guess_format(args.output) if args.output != "-" else "jsonl")
+    storage = open_storage(data_file)
+    if args.output == "-":
+        count = transfer.export_history(storage, sys.stdout, fmt)
+    else:
+        with open(args.output, 'w', newline='') as f:
+            count = transfer.export_history(storage, f, fmt)
+    log.info("Exported %d days", count)
+
+
+def import_command(data_file, args):
+    """Add every day in the given file onto the stored history"""
+    if args.path == "-" and not args.format:
+        sys.exit("Reading from stdin needs --format")
+    fmt = args.format or transfer.guess_format(args.path)
+    os.makedirs(os.path.dirname(data_file), exist_ok=True)
+    storage = open_storage(data_file)
+    try:
+        if args.path == "-":
+            imported, skipped = transfer.import_history(storage, sys.stdin, fmt, args.batch_size)
+        else:
+            with open(args.path, 'r', newline='') as f:
+                imported, skipped = transfer.import_history(storage, f, fmt, args.batch_size)
+    finally:
+        storage.close()  # let a compaction the import started finish before exiting
+    print(f"Imported {imported} days" + (f", skipped {skipped} invalid records" if skipped else ""))
+
+
+def sync_command(data_file, args):
+    """Push this device's new study to the sync server and pull the other devices'"""
+    import sync
+    url = args.server or os.environ.get("STUDY_TIMER_SYNC_URL")
+    if not url:
+        sys.exit("sync needs --server or STUDY_TIMER_SYNC_URL")
+    os.makedirs(os.path.dirname(data_file), exist_ok=True)
+    try:
+        state = sync.SyncState(sync_state_path(data_file))
+        state.use_server(url)
+        client = sync.SyncClient(url, os.environ.get("STUDY_TIMER_SYNC_TOKEN"))
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"Cannot sync: {e}")
+    try:
+        # Only this device's own counters are pushed, never the merged totals
+        summary = sync.sync(open_storage(data_file, synced=False), state, client, args.batch_size)
+    except (OSError, RuntimeError, ValueError) as e:
+        sys.exit(f"Sync failed: {e}")
+    finally:
+        client.close()
+    print(f"Pushed {summary['pushed_days']} days, pulled {summary['pulled_counters']} counters "
+          f"({summary['requests']} requests, {summary['bytes_sent']} bytes sent, "
+          f"{summary['bytes_received']} received)")
+
+
 def main():
     """Main function to run the study timer"""
+    parser = argparse.ArgumentParser(description="Study Timer")
+    subparsers = parser.add_subparsers(dest="command")
+    serve_parser = subparsers.add_parser("serve", help="host many timers behind a local JSON API")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    stats_parser = subparsers.add_parser("stats", help="print rolling totals, streaks and weekday averages")
+    stats_parser.add_argument("--by-month", action="store_true", help="print each month's totals instead")
+    migrate_parser = subparsers.add_parser("migrate", help="copy data.json into the SQLite backend (data/data.db)")
+    migrate_parser.add_argument("--force", action="store_true",
+                                help="replace the days already in data/data.db with the JSON totals")
+    subparsers.add_parser("daemon", help="run the timer headless, controlled over a Unix socket")
+    ctl_parser = subparsers.add_parser("ctl", help="send a command to the running daemon")
+    ctl_parser.add_argument("action", choices=("start", "pause", "toggle", "reset", "break", "study",
+                                               "preset", "status"))
+    ctl_parser.add_argument("preset", nargs="?", choices=("25_5", "50_10"), help="for the preset action")
+    subparsers.add_parser("status", help="print the current countdown from data/status.bin")
+    export_parser = subparsers.add_parser("export", help="stream the study history out as CSV or JSONL")
+    export_parser.add_argument("--output", "-o", default="-", help="file to write (default: stdout)")
+    export_parser.add_argument("--format", choices=("csv", "jsonl"),
+                               help="default: from the --output extension, else jsonl")
+    import_parser = subparsers.add_parser("import", help="add days from a CSV, JSONL or JSON file to the history")
+    import_parser.add_argument("path", help="file to read, or - for stdin")
+    import_parser.add_argument("--format", choices=transfer.FORMATS, help="default: from the file extension")
+    import_parser.add_argument("--batch-size", type=int, default=1000, help="days written per batch")
+    sync_parser = subparsers.add_parser("sync", help="share study totals with your other devices through a sync server")
+    sync_parser.add_argument("--server", help="sync server URL (default: $STUDY_TIMER_SYNC_URL)")
+    sync_parser.add_argument("--batch-size", type=int, default=500, help="days sent per request")
+    parser.add_argument("--profile-startup", nargs="?", const="", metavar="JSON_FILE",
+                        help="print time spent in each startup phase, optionally writing it to JSON_FILE")
+    parser.add_argument("--quit-after-startup", action="store_true",
+                        help="exit as soon as startup finishes (for benchmarks)")
+    parser.add_argument("--log-level", help="DEBUG, INFO, WARNING or ERROR (default: $STUDY_TIMER_LOG_LEVEL or WARNING)")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve Prometheus metrics on 127.0.0.1:PORT/metrics (default: $STUDY_TIMER_METRICS_PORT)")
+    parser.add_argument("--trace-file", help="append JSONL trace events to this file (default: $STUDY_TIMER_TRACE_FILE)")
+    args = parser.parse_args()
+    
+    # Load environment variables
+    from dotenv import load_dotenv
+    load_dotenv()
+    configure_instrumentation(args)
+    
+    if args.command == "serve":
+        from timer_server import serve
+        serve(args.host, args.port)
+        return
+    data_file = os.path.join("data", "data.json")
+    if args.command == "stats":
+        print_stats(data_file, args.by_month)
+        return
+    if args.command == "migrate":
+        try:
+            count = migrate_json_to_sqlite(data_file, force=args.force)
+        except ValueError as e:
+            sys.exit(f"{e}; pass --force to do it anyway")
+        print(f"Migrated {count} days to {sqlite_path(data_file)}")
+        print("Set STUDY_TIMER_STORAGE=sqlite in .env to use it")
+        return
+    if args.command == "daemon":
+        import daemon
+        daemon.run(data_file)
+        return
+    if args.command == "ctl":
+        ctl_command(data_file, args)
+        return
+    if args.command == "status":
+        status_command(data_file)
+        return
+    if args.command == "export":
+        export_command(data_file, args)
+        return
+    if args.command == "import":
+        import_command(data_file, args)
+        return
+    if args.command == "sync":
+        sync_command(data_file, args)
+        return
+    
     print("Starting Study Timer...")
     print("Available presets:")
     print("- 25 / 5 ")
     print("- 50 / 10 ")
     print()
     
-    app = StudyTimer()
+    profiler = None
+    if args.profile_startup is not None or args.quit_after_startup:
+        profiler = StartupProfiler(args.profile_startup or None, args.quit_after_startup)
+    
+    app = StudyTimer(profiler)
     app.run()
 
 
@@ -0,0 +1,327 @@
+"""
+Sync
+Delta sync of the study history between devices through a small server
+Each device only ever adds to its own per-day counters, so the history is
+a grow-only counter per (day, device): merging keeps the larger value of
+each counter and a day's total is the sum over devices. Local storage
+holds this device's counters; the other devices' live in
+data/sync.remote.jsonl and are added on top when the history is read. A
+sync pushes the days updated since the previous sync (by their
+last_updated stamps) and pulls the counters the server has changed since
+the last watermark, as gzipped JSON batches over one keep-alive HTTP
+connection. Neither half rescans the history or rewrites it locally
+"""
+
+import gzip
+import http.client
+import json
+import logging
+import os
+import time
+import urllib.parse
+import uuid
+from datetime import datetime, timedelta
+
+from journal import add_record, file_lock
+
+log = logging.getLogger("study_timer.sync")
+
+# Counters are floats; differences below this are rounding, not study
+EPSILON = 1e-9
+# Local saves stamp last_updated from the local clock. A sync looks back this
+# far before it started, so a save made while it ran, or an hour repeated
+# when the clock goes back, is picked up by the next one
+CURSOR_MARGIN = timedelta(hours=2)
+
+
+class SyncState:
+    """This device's id, the push cursor and pull watermark, and every other device's counters
+
+    sync.json holds the small part and is rewritten on every sync; the
+    other devices' counters are appended to sync.remote.jsonl as they are
+    pulled and replayed (keeping the larger value) when read
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_file = path + ".lock"
+        self.remote_path = os.path.splitext(path)[0] + ".remote.jsonl"
+        self.device = None
+        self.server = None  # URL the cursor and watermark refer to
+        self.cursor = None  # local last_updated from which days still need pushing; None for all
+        self.watermark = 0  # server sequence number of the last counter pulled
+        self.pushed = {}  # day -> [session_count, total_study_time] last sent, for days near the cursor
+        self.remote = {}  # day -> {device: [session_count, total_study_time, last_updated]}
+        self._appended = []  # counters merged since the last save
+        self._remote_lines = 0
+        self._rewrite_remote = False
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                state = json.load(f)
+            self.device = state['device']
+            self.server = state.get('server')
+            self.cursor = state.get('cursor')
+            self.watermark = state['watermark']
+            self.pushed = state['pushed']
+            if 'remote' in state:
+                # Written before the counters had a file of their own
+                self.remote = state['remote']
+                self._rewrite_remote = True
+        if self.device is None:
+            self.device = uuid.uuid4().hex
+        self._read_remote()
+
+    def _read_remote(self):
+        if not os.path.exists(self.remote_path):
+            return
+        with open(self.remote_path, 'r') as f:
+            line = "\n"
+            for line in f:
+                try:
+                    day, device, session_count, total_study_time, last_updated = json.loads(line)
+                except ValueError:
+                    continue  # a torn final line from a crash mid-append
+                self._merge(day, device, session_count, total_study_time, last_updated)
+                self._remote_lines += 1
+            if not line.endswith("\n"):
+                # Appending after a torn line would garble the next one
+                self._rewrite_remote = True
+
+    def save(self):
+        """Append the newly pulled counters, then write the rest atomically
+
+        The counters go first: if the watermark were saved without them, a
+        crash in between would lose them, while pulling them again is harmless
+        """
+        counters = sum(len(devices) for devices in self.remote.values())
+        if self._rewrite_remote or self._remote_lines + len(self._appended) > 2 * counters + 1000:
+            # Mostly superseded counters by now; keep just the latest of each
+            self._write_atomically(self.remote_path, "".join(
+                json.dumps([day, device, *counter], separators=(',', ':')) + "\n"
+                for day, devices in self.remote.items() for device, counter in devices.items()))
+            self._remote_lines = counters
+            self._rewrite_remote = False
+        elif self._appended:
+            with open(self.remote_path, 'a') as f:
+                f.write("".join(json.dumps(line, separators=(',', ':')) + "\n" for line in self._appended))
+                f.flush()
+                os.fsync(f.fileno())
+            self._remote_lines += len(self._appended)
+        self._appended = []
+        self._write_atomically(self.path, json.dumps(
+            {'device': self.device, 'server': self.server, 'cursor': self.cursor,
+             'watermark': self.watermark, 'pushed': self.pushed}, separators=(',', ':')))
+
+    def _write_atomically(self, path, text):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def use_server(self, url):
+        """Start over with a server this device has not synced with (or has forgotten)"""
+        if url != self.server:
+            self.server = url
+            self.cursor = None
+            self.watermark = 0
+            self.pushed = {}
+
+    def merge(self, day, device, session_count, total_study_time, last_updated):
+        """Fold in another device's counter for a day; True if it grew"""
+        if not self._merge(day, device, session_count, total_study_time, last_updated):
+            return False
+        self._appended.append([day, device, *self.remote[day][device]])
+        return True
+
+    def _merge(self, day, device, session_count, total_study_time, last_updated):
+        counters = self.remote.setdefault(day, {})
+        current = counters.get(device)
+        if current is None:
+            counters[device] = [session_count, total_study_time, last_updated]
+            return True
+        merged = [max(current[0], session_count), max(current[1], total_study_time),
+                  max(filter(None, (current[2], last_updated)), default=None)]
+        counters[device] = merged
+        return merged != current
+
+    def remote_totals(self):
+        """{day: record} summed over the other devices"""
+        totals = {}
+        for day, counters in self.remote.items():
+            for session_count, total_study_time, last_updated in counters.values():
+                totals[day] = add_record(totals.get(day), {'session_count': session_count,
+                                                           'total_study_time': total_study_time,
+                                                           'last_updated': last_updated})
+        return totals
+
+
+class SyncedStorage:
+    """Local storage with the other devices' counters added on top when read
+
+    Writes go to the local storage only: they are this device's counters
+    """
+
+    def __init__(self, storage, state_path):
+        self.storage = storage
+        self.state_path = state_path
+
+    def _remote(self):
+        # Re-read on every load, since `study_timer.py sync` may have run meanwhile
+        try:
+            return SyncState(self.state_path).remote_totals()
+        except (OSError, ValueError, KeyError) as e:
+            log.error("Ignoring unreadable sync state %s: %s", self.state_path, e)
+            return {}
+
+    def load(self):
+        all_data = self.storage.load()
+        for day, record in self._remote().items():
+            all_data[day] = add_record(all_data.get(day), record)
+        return all_data
+
+    def days_between(self, start, end):
+        remote = self._remote()
+        days = dict(self.storage.days_between(start, end))
+        for day, record in remote.items():
+            if start <= day <= end:
+                days[day] = add_record(days.get(day), record)
+        return sorted(days.items())
+
+    def iter_days(self):
+        remote = self._remote()
+        for day, record in self.storage.iter_days():
+            yield day, add_record(record, remote.pop(day, {}))
+        yield from sorted(remote.items())
+
+    def add(self, day, record):
+        return self.storage.add(day, record)
+
+    def add_days(self, records):
+        return self.storage.add_days(records)
+
+    def save_days(self, records):
+        return self.storage.save_days(records)
+
+    def close(self):
+        if hasattr(self.storage, "close"):
+            self.storage.close()
+
+
+class SyncClient:
+    """Talks to the sync server over one keep-alive HTTP(S) connection"""
+
+    def __init__(self, url, token=None, timeout=30):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Sync URL must be http:// or https://, not {url!r}")
+        connection = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self._conn = connection(parts.hostname, parts.port, timeout=timeout)
+        self.base_path = parts.path.rstrip("/")
+        self.token = token
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def push(self, device, counters):
+        """Send [day, session_count, total_study_time, last_updated] counters for device"""
+        return self._request("POST", "/v1/counters", {'device': device, 'counters': counters})
+
+    def pull(self, device, since, limit):
+        """Counters changed after watermark `since` on devices other than device"""
+        query = urllib.parse.urlencode({'since': since, 'exclude': device, 'limit': limit})
+        return self._request("GET", f"/v1/counters?{query}")
+
+    def _request(self, method, path, payload=None):
+        headers = {'Accept-Encoding': 'gzip'}
+        body = None
+        if payload is not None:
+            body = gzip.compress(json.dumps(payload, separators=(',', ':')).encode())
+            headers.update({'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        for attempt in range(2):
+            try:
+                self._conn.request(method, self.base_path + path, body, headers)
+                response = self._conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed the idle keep-alive connection; requests are
+                # idempotent, so reconnect and send it once more
+                self._conn.close()
+                if attempt:
+                    raise
+        self.requests += 1
+        self.bytes_sent += len(body or b"")
+        self.bytes_received += len(data)
+        if response.getheader('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        if response.status != 200:
+            raise RuntimeError(f"Sync server answered {response.status}: {data.decode(errors='replace')}")
+        return json.loads(data)
+
+    def close(self):
+        self._conn.close()
+
+
+def changed_days(storage, state):
+    """This device's (day, record) pairs updated since the cursor; every day before the first sync"""
+    if state.cursor is None:
+        return storage.iter_days()
+    return storage.changed_since(state.cursor)
+
+
+def sync(storage, state, client, batch_size=500, page_size=2000):
+    """Push this device's changed days, then pull everyone else's; returns a summary dict
+
+    storage must be the local storage, not a SyncedStorage. Both halves
+    are idempotent, so an interrupted sync is simply run again
+    """
+    started = time.perf_counter()
+    with file_lock(state.lock_file):
+        # Days stamped after this are looked at again by the next sync
+        cursor = (datetime.now() - CURSOR_MARGIN).isoformat()
+        recent = {}  # what the next sync will compare against
+        pushed = 0
+        batch = []
+        for day, record in changed_days(storage, state):
+            counters = [record.get('session_count', 0), record.get('total_study_time', 0)]
+            if (record.get('last_updated') or "") >= cursor:
+                recent[day] = counters
+            last = state.pushed.get(day)
+            if (last is not None and abs(counters[0] - last[0]) <= EPSILON
+                    and abs(counters[1] - last[1]) <= EPSILON):
+                continue  # sent by the previous sync and unchanged since
+            batch.append([day, *counters, record.get('last_updated')])
+            if len(batch) >= batch_size:
+                pushed += _push(client, state, batch)
+                batch = []
+        if batch:
+            pushed += _push(client, state, batch)
+        state.pushed = recent
+        state.cursor = cursor
+
+        pulled = 0
+        while True:
+            page = client.pull(state.device, state.watermark, page_size)
+            for day, device, session_count, total_study_time, last_updated in page['counters']:
+                pulled += state.merge(day, device, session_count, total_study_time, last_updated)
+            state.watermark = page['watermark']
+            if not page['more']:
+                break
+        state.save()
+    return {
+        'pushed_days': pushed,
+        'pulled_counters': pulled,
+        'requests': client.requests,
+        'bytes_sent': client.bytes_sent,
+        'bytes_received': client.bytes_received,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def _push(client, state, batch):
+    client.push(state.device, batch)
+    return len(batch)
@@ -0,0 +1,224 @@
+"""
+Sync Server
+Self-hosted stand-in for the study history sync service
+Keeps the latest per-(day, device) counters, merged by taking the larger
+value, and stamps every change with a sequence number so clients can pull
+just what changed since their watermark. Changes are appended to a JSONL
+log, which is replayed on start
+
+Run with: python sync_server.py --port 8770 --data sync_server.jsonl
+"""
+
+import argparse
+import bisect
+import gzip
+import hmac
+import json
+import logging
+import math
+import os
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+log = logging.getLogger("study_timer.sync_server")
+
+MAX_PAGE = 10000
+
+
+def parse_counter(row):
+    """Check one pushed [day, session_count, total_study_time, last_updated] row
+
+    Raises ValueError or TypeError for anything malformed
+    """
+    day, session_count, total_study_time, last_updated = row
+    date.fromisoformat(day)
+    session_count, total_study_time = float(session_count), float(total_study_time)
+    if not all(math.isfinite(value) and value >= 0 for value in (session_count, total_study_time)):
+        raise ValueError(f"Counters for {day} must be finite and not negative")
+    if last_updated is not None and not isinstance(last_updated, str):
+        raise TypeError(f"last_updated for {day} must be a string or null")
+    return day, session_count, total_study_time, last_updated
+
+
+def merge_counter(current, session_count, total_study_time, last_updated):
+    """[session_count, total_study_time, last_updated] merged onto current (or None)"""
+    if current is None:
+        return [session_count, total_study_time, last_updated]
+    return [max(current[0], session_count), max(current[1], total_study_time),
+            max(filter(None, (current[2], last_updated)), default=None)]
+
+
+class CounterStore:
+    """Merged counters plus a sequence-ordered change log for watermark pulls"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self.counters = {}  # (day, device) -> [session_count, total_study_time, last_updated, sequence]
+        # Sequence numbers in increasing order and the key changed at each; an
+        # entry is stale once its key has changed again with a later sequence
+        self._sequences = []
+        self._keys = []
+        self.sequence = 0
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        day, device, session_count, total_study_time, last_updated = json.loads(line)
+                    except ValueError:
+                        continue  # torn final line
+                    self._merge(day, device, session_count, total_study_time, last_updated)
+
+    def push(self, device, counters):
+        """Merge a device's [day, session_count, total_study_time, last_updated] counters
+
+        The whole request is checked before anything changes, then logged
+        and merged as one step, so a bad row or a failed log write leaves
+        the store as it was. Returns the number of days that changed
+        """
+        if not isinstance(device, str) or not device:
+            raise ValueError("device must be a non-empty string")
+        if not isinstance(counters, list):
+            raise TypeError("counters must be a list")
+        rows = [parse_counter(row) for row in counters]
+        with self._lock:
+            staged = {}  # day -> merged counter, for the days this push changes
+            for day, session_count, total_study_time, last_updated in rows:
+                current = staged.get(day) or self.counters.get((day, device))
+                merged = merge_counter(current, session_count, total_study_time, last_updated)
+                if current is None or merged != current[:3]:
+                    staged[day] = merged
+            changed = [[day, device, *counter] for day, counter in staged.items()]
+            if changed and self.path is not None:
+                with open(self.path, 'a') as f:
+                    f.write("".join(json.dumps(entry) + "\n" for entry in changed))
+            for entry in changed:
+                self._merge(*entry)
+            return len(changed)
+
+    def pull(self, since, exclude=None, limit=MAX_PAGE):
+        """Counters changed after sequence `since`: (rows, watermark, more)"""
+        rows = []
+        with self._lock:
+            position = bisect.bisect_right(self._sequences, since)
+            watermark = since
+            while position < len(self._sequences) and len(rows) < limit:
+                sequence, key = self._sequences[position], self._keys[position]
+                position += 1
+                watermark = sequence
+                current = self.counters[key]
+                if current[3] != sequence or key[1] == exclude:
+                    continue
+                rows.append([key[0], key[1]] + current[:3])
+            return rows, watermark, position < len(self._sequences)
+
+    def _merge(self, day, device, session_count, total_study_time, last_updated):
+        key = (day, device)
+        current = self.counters.get(key)
+        if current is not None:
+            merged = merge_counter(current, session_count, total_study_time, last_updated)
+            if merged == current[:3]:
+                return False
+            session_count, total_study_time, last_updated = merged
+        self.sequence += 1
+        self.counters[key] = [session_count, total_study_time, last_updated, self.sequence]
+        self._sequences.append(self.sequence)
+        self._keys.append(key)
+        return True
+
+
+class SyncHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so a client reuses one connection
+    # Headers and body go out in separate writes; without this, Nagle's algorithm
+    # holds the body back until the client's delayed ACK (~40 ms per request)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if not self.accept(url.path):
+            return
+        query = parse_qs(url.query)
+        try:
+            since = int(query.get('since', ["0"])[0])
+            limit = min(int(query.get('limit', [str(MAX_PAGE)])[0]), MAX_PAGE)
+        except ValueError:
+            self.reply(400, {'error': "since and limit must be integers"})
+            return
+        rows, watermark, more = self.server.store.pull(since, query.get('exclude', [None])[0], limit)
+        self.reply(200, {'counters': rows, 'watermark': watermark, 'more': more})
+
+    def do_POST(self):
+        # Read the body even when refusing it, so the connection stays usable
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.accept(urlsplit(self.path).path):
+            return
+        try:
+            if self.headers.get('Content-Encoding') == "gzip":
+                body = gzip.decompress(body)
+            payload = json.loads(body)
+            changed = self.server.store.push(payload['device'], payload['counters'])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.reply(400, {'error': str(e)})
+            return
+        self.reply(200, {'changed': changed, 'watermark': self.server.store.sequence})
+
+    def accept(self, path):
+        """Check the path and bearer token (if the server has one), replying with the error if not"""
+        if path != "/v1/counters":
+            self.reply(404, {'error': "not found"})
+            return False
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get('Authorization', ""), f"Bearer {token}"):
+            self.reply(401, {'error': "unauthorized"})
+            return False
+        return True
+
+    def reply(self, status, payload):
+        data = json.dumps(payload, separators=(',', ':')).encode()
+        gzipped = "gzip" in self.headers.get('Accept-Encoding', "")
+        if gzipped:
+            data = gzip.compress(data)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        log.debug("%s " + format, self.address_string(), *args)
+
+
+def make_server(host="127.0.0.1", port=8770, path=None, token=None):
+    """A SyncHandler server bound to host:port (port 0 picks a free one)"""
+    server = ThreadingHTTPServer((host, port), SyncHandler)
+    server.daemon_threads = True
+    server.store = CounterStore(path)
+    server.token = token
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Study Timer sync server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8770)
+    parser.add_argument("--data", help="JSONL file the counters are kept in (default: memory only)")
+    parser.add_argument("--token", default=os.environ.get("STUDY_TIMER_SYNC_TOKEN"),
+                        help="require this bearer token (default: $STUDY_TIMER_SYNC_TOKEN)")
+    args = parser.parse_args()
+    logging.basicConfig(format="%(levelname)s %(name)s: %(message)s", level=logging.INFO)
+    server = make_server(args.host, args.port, args.data, args.token)
+    print(f"Sync server listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Timer Server
+Hosts many independent study timers behind a local API
+All timers are driven by one asyncio task and a heap of deadlines, so an
+idle timer costs one StudyEngine object and no threads
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+
+from timer_engine import SystemClock, StudyEngine
+
+# The loop's clock stops during suspend while the deadlines' does not, so
+# never sleep longer than this before re-checking them
+MAX_SLEEP = 5.0
+
+
+class TimerScheduler:
+    """Drives many StudyEngine timers from a single deadline heap"""
+
+    def __init__(self, clock=None):
+        self.clock = clock or SystemClock()
+        self.timers = {}  # timer id -> StudyEngine
+        self.completions = 0
+
+        # (deadline, timer id) for running timers; entries whose deadline no
+        # longer matches the engine's are stale and skipped when popped
+        self._heap = []
+        self._ids = itertools.count(1)
+        self._wakeup = None
+
+    def create(self, study_duration=25, break_duration=5):
+        """Create a paused timer and return its id"""
+        timer_id = str(next(self._ids))
+        engine = StudyEngine(clock=self.clock)
+        engine.set_durations(study_duration, break_duration)
+        engine.reset()
+        self.timers[timer_id] = engine
+        return timer_id
+
+    def remove(self, timer_id):
+        """Forget a timer; its heap entry is dropped lazily"""
+        self.timers.pop(timer_id)
+
+    def start(self, timer_id):
+        engine = self.timers[timer_id]
+        engine.start()
+        self._schedule(engine, timer_id)
+
+    def pause(self, timer_id):
+        self.timers[timer_id].pause()
+
+    def reset(self, timer_id):
+        self.timers[timer_id].reset()
+
+    def start_break(self, timer_id):
+        engine = self.timers[timer_id]
+        engine.start_break()
+        self._schedule(engine, timer_id)
+
+    def start_study(self, timer_id):
+        engine = self.timers[timer_id]
+        engine.start_study()
+        self._schedule(engine, timer_id)
+
+    def query(self, timer_id):
+        """Current state of a timer, with the remaining time computed on demand"""
+        engine = self.timers[timer_id]
+        return {
+            'id': timer_id,
+            'mode': 'study' if engine.is_study_time else 'break',
+            'running': engine.is_running,
+            'time_remaining': engine.countdown.remaining() if engine.is_running else engine.time_remaining,
+            'study_duration': engine.study_duration,
+            'break_duration': engine.break_duration,
+            'session_count': engine.session_count,
+            'total_study_time': engine.total_study_time,
+        }
+
+    def _schedule(self, engine, timer_id):
+        """Add a running timer's deadline to the heap"""
+        if not engine.is_running:
+            return
+        deadline = engine.countdown.deadline
+        # Wake the run loop if this deadline is now the earliest
+        if (not self._heap or deadline < self._heap[0][0]) and self._wakeup is not None:
+            self._wakeup.set()
+        heapq.heappush(self._heap, (deadline, timer_id))
+
+    def fire_due(self):
+        """Complete every timer whose deadline has passed; return the next deadline"""
+        now = self.clock.monotonic()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            deadline, timer_id = heapq.heappop(heap)
+            engine = self.timers.get(timer_id)
+            if engine is None or not engine.is_running or engine.countdown.deadline != deadline:
+                continue  # stale entry from a paused, restarted or removed timer
+            engine.tick()
+            engine.complete()
+            self.completions += 1
+        return heap[0][0] if heap else None
+
+    async def run(self):
+        """Fire deadlines forever, sleeping until the earliest one"""
+        self._wakeup = asyncio.Event()
+        while True:
+            next_deadline = self.fire_due()
+            timeout = None
+            if next_deadline is not None:
+                timeout = min(max(0.0, next_deadline - self.clock.monotonic()), MAX_SLEEP)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class JsonLineServer:
+    """Line-delimited JSON requests dispatched to self.commands by their 'cmd'"""
+
+    commands = {}
+
+    def handle(self, request):
+        """Run one decoded request and return the response dict"""
+        try:
+            command = self.commands[request.pop('cmd')]
+            result = command(**request)
+            response = {'ok': True}
+            if result is not None:
+                response['result'] = result
+            return response
+        except KeyError as e:
+            return {'ok': False, 'error': f"unknown command or timer: {e}"}
+        except Exception as e:
+            return {'ok': False, 'error': str(e)}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = self.handle(json.loads(line))
+                except ValueError as e:
+                    response = {'ok': False, 'error': f"invalid JSON: {e}"}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+class TimerServer(JsonLineServer):
+    """Line-delimited JSON API over a localhost TCP socket"""
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.commands = {
+            'create': self._create,
+            'start': scheduler.start,
+            'pause': scheduler.pause,
+            'reset': scheduler.reset,
+            'break': scheduler.start_break,
+            'study': scheduler.start_study,
+            'remove': scheduler.remove,
+            'query': scheduler.query,
+        }
+
+    def _create(self, study_duration=25, break_duration=5):
+        return self.scheduler.create(study_duration, break_duration)
+
+
+async def run_server(host="127.0.0.1", port=8765):
+    scheduler = TimerScheduler()
+    server = TimerServer(scheduler)
+    listener = await asyncio.start_server(server.handle_connection, host, port)
+    print(f"Timer server listening on {host}:{port}")
+    async with listener:
+        await asyncio.gather(listener.serve_forever(), scheduler.run())
+
+
+def serve(host="127.0.0.1", port=8765):
+    """Run the timer server until interrupted"""
+    try:
+        asyncio.run(run_server(host, port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,113 @@
+"""
+Transfer
+Streaming export and import of the study history as CSV or JSONL
+Records pass through generators one at a time in both directions, so
+memory use stays flat no matter how long the history is. Imports are
+written in batches and add onto existing days, the same way saves do
+"""
+
+import csv
+import json
+import logging
+import os
+from datetime import date, datetime
+
+from journal import iter_json_object
+
+log = logging.getLogger("study_timer.transfer")
+
+FORMATS = ("csv", "jsonl", "json")
+FIELDS = ("date", "session_count", "total_study_time", "last_updated")
+
+
+def guess_format(path):
+    """Pick a format from a file extension (.csv, .jsonl, .json)"""
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension == "ndjson":
+        return "jsonl"
+    if extension in FORMATS:
+        return extension
+    raise ValueError(f"Cannot tell the format of {path}; pass --format ({', '.join(FORMATS)})")
+
+
+def write_records(records, f, fmt):
+    """Write (day, record) pairs to a text file one row at a time; returns the row count"""
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for day, record in records:
+            writer.writerow((day, record.get('session_count', 0), record.get('total_study_time', 0),
+                             record.get('last_updated') or ""))
+            count += 1
+    elif fmt == "jsonl":
+        for day, record in records:
+            f.write(json.dumps({'date': day, **record}) + "\n")
+            count += 1
+    else:
+        raise ValueError(f"Cannot export as {fmt!r}; expected csv or jsonl")
+    return count
+
+
+def read_records(f, fmt):
+    """Yield (line, day, record) from a CSV, JSONL or JSON-object file without reading it all"""
+    if fmt == "csv":
+        for row in csv.DictReader(f):
+            yield row, row.get('date'), row
+    elif fmt == "jsonl":
+        for line in f:
+            if line.strip():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                if not isinstance(entry, dict):
+                    entry = {}  # reported as invalid by the caller
+                yield line.strip(), entry.get('date'), entry
+    elif fmt == "json":
+        # A data.json-style {date: record} object, parsed one member at a time
+        for day, record in iter_json_object(f):
+            yield day, day, record
+    else:
+        raise ValueError(f"Cannot import {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+
+def normalise(day, record, last_updated):
+    """Validate one imported day, returning a storable record stamped last_updated"""
+    date.fromisoformat(day)  # raises ValueError for anything that is not YYYY-MM-DD
+    return {
+        'session_count': float(record.get('session_count') or 0),
+        'total_study_time': float(record.get('total_study_time') or 0),
+        'last_updated': last_updated,
+    }
+
+
+def export_history(storage, f, fmt):
+    """Stream every stored day to f; returns the number of days written"""
+    return write_records(storage.iter_days(), f, fmt)
+
+
+def import_history(storage, f, fmt, batch_size=1000):
+    """Add every record in f onto storage in batches; returns (imported, skipped)"""
+    imported = skipped = 0
+    batch = []
+    # The days change here now, whenever the file says they last did, so the
+    # next sync sends them
+    imported_at = datetime.now().isoformat()
+    for source, day, record in read_records(f, fmt):
+        if day is not None and day.startswith("_"):
+            continue  # bookkeeping keys in a data.json snapshot
+        try:
+            batch.append((day, normalise(day, record, imported_at)))
+        except (AttributeError, TypeError, ValueError) as e:
+            log.warning("Skipping invalid record %r: %s", source, e)
+            skipped += 1
+            continue
+        if len(batch) >= batch_size:
+            storage.add_days(batch)
+            imported += len(batch)
+            batch = []
+    if batch:
+        storage.add_days(batch)
+        imported += len(batch)
+    return imported, skipped